@@ -1,122 +1,757 @@
+import copy
+import json
+import multiprocessing
+import os
 import random
+import sys
+import threading
+import time
+from Book import BOOK_FILE, OpeningBook
+from Engine import PIECE_VALUES
 from Rating import load_ratings, save_ratings, PlayerRating
+from Tablebase import probe as probe_tablebase
 
 CHECKMATE = 10000
 STALEMATE = 0
+TABLEBASE_WIN = CHECKMATE // 2
 DEFAULT_DEPTH = 2 
-piece_scores = {
-    "K": 0, 
-    "Q": 9,
-    "R": 5,
-    "B": 3,
-    "N": 3,
-    "p": 1
-}
+DEFAULT_HASH_MB = 16
+DEFAULT_PROCESSES = 1
 
-ratings = load_ratings()
-white_player = ratings["white"]
-black_player = ratings["black"]
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+MAX_PLY = 64
+# Scores past MATE_BOUND are mates or tablebase wins; they depend on the distance from the root,
+# so the transposition table holds them relative to the node instead
+MATE_BOUND = TABLEBASE_WIN - 1000
 
+# Search scores are in pawns, so a null window is one centipawn wide
+NULL_WINDOW = 0.01
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+# Quiet moves from the LMR_MIN_MOVES-th on are searched a ply shallower (two plies from
+# LMR_LATE_MOVES on at LMR_DEEP_DEPTH and above) and re-searched if they beat alpha anyway
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3
+LMR_LATE_MOVES = 6
+LMR_DEEP_DEPTH = 6
+# Root window around the previous iteration's score, widened fourfold on every fail
+ASPIRATION_MIN_DEPTH = 3
+ASPIRATION_WINDOW = 0.5
+ASPIRATION_LIMIT = 8
 
+# Move ordering bands: hash move, then captures by MVV-LVA, promotions, killers, then quiet moves by history
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+PROMOTION_SCORE = 90000
+KILLER_SCORES = (80000, 79000)
+HISTORY_LIMIT = 70000
+ATTACKER_RANKS = {"p": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
 
-def get_ai_parameters(rating):
-    if rating < 1000:
-        return {"depth": 1, "randomness": 0.4}
-    elif rating < 1300:
-        return {"depth": 2, "randomness": 0.3}
-    elif rating < 1600:
-        return {"depth": 3, "randomness": 0.2}
-    elif rating < 1900:
-        return {"depth": 4, "randomness": 0.1}
-    else:
-        return {"depth": 5, "randomness": 0.05}
+# Quiescence skips captures that cannot lift the score back to alpha even with this much to spare
+DELTA_MARGIN = 2
+piece_scores = PIECE_VALUES
 
+# Loaded on the first rated game, so importing the engine never touches the rating store
+white_player = None
+black_player = None
 
-def pick_best_move(game_state, valid_moves, ai_rating):
-    params = get_ai_parameters(ai_rating)
-    depth = params["depth"]
-    randomness = params["randomness"]
 
-    global next_move
-    next_move = None
-    random.shuffle(valid_moves)
+class TranspositionTable:
+    # Rough CPython footprint of one filled slot: the key int, the entry tuple and two list slots.
+    ENTRY_BYTES = 160
 
-    # Add randomness for weaker AIs
-    if random.random() < randomness:
-        return random.choice(valid_moves)
+    def __init__(self, size_mb=DEFAULT_HASH_MB):
+        self.resize(size_mb)
 
-    # Start search and remember starting depth
-    alpha_beta(game_state, valid_moves, depth, -CHECKMATE, CHECKMATE, game_state.white_turn, ai_rating, starting_depth=depth)
+    def resize(self, size_mb):
+        # Power-of-two slot count so the index is a mask of the Zobrist key.
+        self.size_mb = size_mb
+        slots = max(1, int(size_mb * 1024 * 1024) // self.ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 1
+        self.clear()
 
-    # Fallback if no move was chosen
-    if next_move is None and valid_moves:
-        print(" AI failed to find a move, picking random fallback.")
-        return random.choice(valid_moves)
+    def clear(self):
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size
+        self.generation = 0
 
-    return next_move
+    def new_search(self):
+        self.generation += 1
 
+    def probe(self, key):
+        index = key & self.mask
+        if self.keys[index] == key:
+            return self.entries[index]
+        return None
 
-def alpha_beta(game_state, valid_moves, depth, alpha, beta, white_turn, ai_rating, starting_depth):
-    global next_move
+    def store(self, key, depth, flag, score, best_move_id):
+        # Depth-preferred: keep the deeper entry unless it is left over from an earlier search.
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is not None and self.keys[index] != key and entry[4] == self.generation and entry[0] > depth:
+            return
+        self.keys[index] = key
+        self.entries[index] = (depth, flag, score, best_move_id, self.generation)
 
-    # Stop at leaf or stalemate/checkmate
-    if depth == 0 or len(valid_moves) == 0:
-        return evaluate_board(game_state.board, ai_rating)
 
-    if white_turn:
-        max_eval = -CHECKMATE
-        for move in order_moves(valid_moves):
-            game_state.make_move(move)
-            next_moves = game_state.get_legal_moves()
-            eval_score = alpha_beta(game_state, next_moves, depth - 1, alpha, beta, False, ai_rating, starting_depth)
-            game_state.undo_move()
+transposition_table = TranspositionTable()
 
-            if eval_score > max_eval:
-                max_eval = eval_score
-                # Only set next_move at the *root* call
-                if depth == starting_depth:
-                    next_move = move
 
-            alpha = max(alpha, eval_score)
-            if beta <= alpha:
-                break
-        return max_eval
+def set_hash_size(size_mb):
+    transposition_table.resize(size_mb)
+
+
+_opening_books = {}
 
+
+def get_opening_book(path=BOOK_FILE):
+    # Opened once per process and kept mapped; a missing book just means every move is searched
+    if path not in _opening_books:
+        _opening_books[path] = OpeningBook(path) if os.path.exists(path) else None
+    return _opening_books[path]
+
+
+
+def get_ai_parameters(rating):
+    # "depth" caps iterative deepening, "time" is the per-move budget in seconds
+    if rating < 1000:
+        return {"depth": 1, "randomness": 0.4, "time": 0.5}
+    elif rating < 1300:
+        return {"depth": 2, "randomness": 0.3, "time": 1.0}
+    elif rating < 1600:
+        return {"depth": 3, "randomness": 0.2, "time": 2.0}
+    elif rating < 1900:
+        return {"depth": 4, "randomness": 0.1, "time": 3.0}
     else:
-        min_eval = CHECKMATE
-        for move in order_moves(valid_moves):
-            game_state.make_move(move)
-            next_moves = game_state.get_legal_moves()
-            eval_score = alpha_beta(game_state, next_moves, depth - 1, alpha, beta, True, ai_rating, starting_depth)
-            game_state.undo_move()
+        return {"depth": 5, "randomness": 0.05, "time": 5.0}
+
+
+class SearchAborted(Exception):
+    pass
+
+
+# Per-search counters, kept on SearchContext while searching and copied into SearchStats.
+# The *_time entries are seconds spent generating moves, testing for check and evaluating.
+SEARCH_COUNTERS = ("nodes", "quiescence_nodes", "beta_cutoffs", "first_move_cutoffs", "tt_probes", "tt_hits",
+                   "tt_stores", "movegen_time", "legality_time", "eval_time")
+
+
+class SearchContext:
+    def __init__(self, table, time_limit=None, node_limit=None, stop_event=None):
+        self.table = table
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self.node_limit = node_limit
+        self.stop_event = stop_event
+        for counter in SEARCH_COUNTERS:
+            setattr(self, counter, 0)
+        self.pv = []
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {'w': {}, 'b': {}}
+        self.start_time = time.perf_counter()
+
+    def record_cutoff(self, move, depth, ply):
+        # Quiet moves that refute a line become killers for the ply and gain history weight
+        if move.piece_taken != "--" or move.pawn_promotion:
+            return
+        killers = self.killers[min(ply, MAX_PLY - 1)]
+        if killers[0] != move.move_id:
+            killers[1] = killers[0]
+            killers[0] = move.move_id
+        history = self.history[move.piece_moved[0]]
+        history[move.move_id] = history.get(move.move_id, 0) + depth * depth
+        if history[move.move_id] > HISTORY_LIMIT:
+            for move_id in history:
+                history[move_id] //= 2
+
+    def check_budget(self):
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise SearchAborted()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchAborted()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchAborted()
+
+    def counters(self):
+        return {counter: getattr(self, counter) for counter in SEARCH_COUNTERS}
+
+    # The search calls the engine through these so each phase's time is accounted for
+    def legal_moves(self, game_state):
+        # alpha_beta applies the drawing rules itself, so only legality is needed here
+        start = time.perf_counter()
+        moves = game_state.generate_legal_moves()
+        self.movegen_time += time.perf_counter() - start
+        return moves
+
+    def quiescence_moves(self, game_state, in_check):
+        start = time.perf_counter()
+        moves = game_state.generate_legal_moves() if in_check else game_state.generate_legal_captures()
+        self.movegen_time += time.perf_counter() - start
+        return moves
+
+    def in_check(self, game_state):
+        start = time.perf_counter()
+        in_check = game_state.in_check()
+        self.legality_time += time.perf_counter() - start
+        return in_check
+
+    def evaluate(self, game_state, ai_rating):
+        start = time.perf_counter()
+        score = evaluate_board(game_state, ai_rating)
+        self.eval_time += time.perf_counter() - start
+        return score
+
+
+class SearchStats:
+    # Filled in by pick_best_move. With a log stream, every finished iteration and the final
+    # totals are also written to it as one JSON object per line.
+    def __init__(self, log=None, on_iteration=None):
+        self.log = log
+        # called with each iteration's dict as soon as it completes, e.g. to report progress
+        self.on_iteration = on_iteration
+        self.depth = 0
+        self.seconds = 0.0
+        for counter in SEARCH_COUNTERS:
+            setattr(self, counter, 0)
+        # one dict per completed iteration: depth, score, best move, principal variation and totals so far
+        self.iterations = []
+
+    @property
+    def nps(self):
+        return round(self.nodes / self.seconds) if self.seconds > 0 else 0
+
+    @property
+    def first_move_cutoff_rate(self):
+        # How often the first move searched was the one that failed high; a measure of move ordering
+        return self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    @property
+    def tt_store_rate(self):
+        return self.tt_stores / self.nodes if self.nodes else 0.0
+
+    def _update(self, counters, seconds):
+        for counter in SEARCH_COUNTERS:
+            setattr(self, counter, counters[counter])
+        self.seconds = seconds
+
+    def summary(self):
+        summary = {"depth": self.depth, "seconds": round(self.seconds, 4), "nps": self.nps}
+        for counter in SEARCH_COUNTERS:
+            value = getattr(self, counter)
+            summary[counter] = round(value, 4) if isinstance(value, float) else value
+        summary["first_move_cutoff_rate"] = round(self.first_move_cutoff_rate, 4)
+        summary["tt_hit_rate"] = round(self.tt_hit_rate, 4)
+        summary["tt_store_rate"] = round(self.tt_store_rate, 4)
+        return summary
+
+    def record_iteration(self, depth, counters, seconds, best_move, score, pv):
+        self._update(counters, seconds)
+        self.depth = depth
+        iteration = dict(self.summary(), score=round(score, 2), best_move=best_move.get_notation(),
+                         pv=[move.get_notation() for move in pv] or [best_move.get_notation()])
+        self.iterations.append(iteration)
+        self._emit("iteration", iteration)
+        if self.on_iteration is not None:
+            self.on_iteration(iteration)
+
+    def finish(self, counters, seconds):
+        # Totals include the iteration that was cut short, so they can exceed the last iteration's
+        self._update(counters, seconds)
+        self._emit("search", self.summary())
+
+    def _emit(self, event, record):
+        if self.log is not None:
+            self.log.write(json.dumps(dict(record, event=event)) + "\n")
+            self.log.flush()
+
+
+def pick_best_move(game_state, valid_moves, ai_rating, table=None, time_limit=None, node_limit=None,
+                   stop_event=None, processes=DEFAULT_PROCESSES, stats=None, book_path=BOOK_FILE, params=None):
+    if table is None:
+        table = transposition_table
+    # params overrides individual tier settings, e.g. {"depth": 3} when calibrating the tiers
+    params = dict(get_ai_parameters(ai_rating), **(params or {}))
+    max_depth = params["depth"]
+    randomness = params["randomness"]
+    if time_limit is None and node_limit is None:
+        time_limit = params["time"]
 
-            if eval_score < min_eval:
-                min_eval = eval_score
-                if depth == starting_depth:
-                    next_move = move
+    random.shuffle(valid_moves)
 
-            beta = min(beta, eval_score)
-            if beta <= alpha:
-                break
-        return min_eval
+    tablebase_move = pick_tablebase_move(game_state, valid_moves)
+    if tablebase_move is not None:
+        return tablebase_move
 
+    book = get_opening_book(book_path) if book_path else None
+    if book is not None:
+        book_move = book.choose_move(game_state, valid_moves, ai_rating)
+        if book_move is not None:
+            return book_move
 
+    # Add randomness for weaker AIs
+    if random.random() < randomness:
+        return random.choice(valid_moves)
 
-def order_moves(moves):
-    return sorted(moves, key=lambda m: m.piece_taken != "--", reverse=True)
+    if processes > 1 and len(valid_moves) > 1:
+        best_move = _pick_best_move_parallel(game_state, valid_moves, ai_rating, max_depth,
+                                             time_limit, node_limit, stop_event, processes, stats)
+    else:
+        best_move = _pick_best_move_serial(game_state, valid_moves, ai_rating, max_depth,
+                                           table, time_limit, node_limit, stop_event, stats)
+
+    # Fallback if no move was chosen
+    if best_move is None and valid_moves:
+        print(" AI failed to find a move, picking random fallback.", file=sys.stderr)
+        return random.choice(valid_moves)
+
+    return best_move
+
+
+def _pick_best_move_serial(game_state, valid_moves, ai_rating, max_depth, table, time_limit, node_limit, stop_event,
+                           stats):
+    # Deepen one ply at a time and keep the result of the last iteration that finished
+    table.new_search()
+    context = SearchContext(table, time_limit, node_limit, stop_event)
+    history_length = len(game_state.move_history)
+    best_move, score = None, None
+    for depth in range(1, max_depth + 1):
+        try:
+            score, move = search_root(game_state, valid_moves, depth, ai_rating, context, score)
+        except SearchAborted:
+            while len(game_state.move_history) > history_length:
+                game_state.undo_move()
+            break
+        if move is not None:
+            best_move = move
+            context.pv = principal_variation(game_state, table, depth)
+            if stats is not None:
+                stats.record_iteration(depth, context.counters(), time.perf_counter() - context.start_time,
+                                       move, score, context.pv)
+    if stats is not None:
+        stats.finish(context.counters(), time.perf_counter() - context.start_time)
+    return best_move
+
+
+def analyse_position(game_state, max_depth=MAX_PLY, time_limit=None, node_limit=None, stats=None, ai_rating=2000):
+    # Plain iterative deepening for test suites: no book, tablebase shortcut or random moves,
+    # and a move is returned even where the drawing rules would end the game
+    valid_moves = game_state.generate_legal_moves()
+    if not valid_moves:
+        return None
+    return _pick_best_move_serial(game_state, valid_moves, ai_rating, max_depth, transposition_table,
+                                  time_limit, node_limit, None, stats)
+
+
+# Root-splitting parallel search: every iteration hands each worker process a share of the
+# root moves, and the shares' best scores are compared once all of them finish that depth.
+_pool = None
+_pool_size = 0
+_pool_hash_mb = None
+_pool_stop = None
+_worker_stop = None
+
+
+def _get_pool(processes):
+    # Every worker keeps a table of the configured size, so a new size needs new workers
+    global _pool, _pool_size, _pool_hash_mb, _pool_stop
+    hash_mb = transposition_table.size_mb
+    if _pool is None or _pool_size != processes or _pool_hash_mb != hash_mb:
+        if _pool is not None:
+            _pool.terminate()
+        # spawn rather than fork: the GUI calls in here from a worker thread
+        mp_context = multiprocessing.get_context("spawn")
+        _pool_stop = mp_context.Event()
+        _pool = mp_context.Pool(processes, initializer=_init_pool_worker, initargs=(_pool_stop, hash_mb))
+        _pool_size = processes
+        _pool_hash_mb = hash_mb
+    return _pool, _pool_stop
+
+
+def _init_pool_worker(stop, hash_mb):
+    global _worker_stop
+    _worker_stop = stop
+    transposition_table.resize(hash_mb)
+
+
+def _search_root_share(args):
+    game_state, moves, depth, ai_rating, time_limit, node_limit = args
+    transposition_table.new_search()
+    context = SearchContext(transposition_table, time_limit, node_limit, _worker_stop)
+    try:
+        score, move = search_root(game_state, moves, depth, ai_rating, context)
+    except SearchAborted:
+        return None
+    return score, move, context.counters()
+
+
+def _pick_best_move_parallel(game_state, valid_moves, ai_rating, max_depth, time_limit, node_limit,
+                             stop_event, processes, stats):
+    pool, pool_stop = _get_pool(processes)
+    pool_stop.clear()
+    start_time = time.perf_counter()
+    deadline = None if time_limit is None else start_time + time_limit
+    totals = dict.fromkeys(SEARCH_COUNTERS, 0)
+    ordered = list(valid_moves)
+    best_move = None
+    for depth in range(1, max_depth + 1):
+        remaining_time = None if deadline is None else deadline - time.perf_counter()
+        if remaining_time is not None and remaining_time <= 0:
+            break
+        if node_limit is not None and totals["nodes"] >= node_limit:
+            break
+        worker_nodes = None if node_limit is None else max(1, (node_limit - totals["nodes"]) // processes)
+
+        # Deal the ordered moves round-robin so every worker gets some of the promising ones
+        shares = [ordered[i::processes] for i in range(processes) if ordered[i::processes]]
+        pending = pool.map_async(_search_root_share, [
+            (game_state, share, depth, ai_rating, remaining_time, worker_nodes) for share in shares
+        ])
+        while not pending.ready():
+            pending.wait(0.05)
+            if stop_event is not None and stop_event.is_set():
+                pool_stop.set()
+        results = pending.get()
+        if any(result is None for result in results):
+            break
+
+        for result in results:
+            for counter, value in result[2].items():
+                totals[counter] += value
+        results.sort(key=lambda result: result[0], reverse=game_state.white_turn)
+        best_move = results[0][1]
+        if stats is not None:
+            stats.record_iteration(depth, totals, time.perf_counter() - start_time, best_move, results[0][0], [])
+        best_ids = [result[1].move_id for result in results]
+        ordered.sort(key=lambda m: best_ids.index(m.move_id) if m.move_id in best_ids else len(best_ids))
+    if stats is not None:
+        stats.finish(totals, time.perf_counter() - start_time)
+    return best_move
+
+
+class SearchWorker:
+    # Searches a private copy of the position on a background thread so the caller can keep polling.
+    def __init__(self, game_state, valid_moves, ai_rating, **search_options):
+        self.stop_event = threading.Event()
+        self.result = None
+        state_copy, moves_copy = copy.deepcopy((game_state, valid_moves))
+        self.thread = threading.Thread(
+            target=self._run, args=(state_copy, moves_copy, ai_rating, search_options), daemon=True
+        )
+        self.thread.start()
+
+    def _run(self, game_state, valid_moves, ai_rating, search_options):
+        self.result = pick_best_move(game_state, valid_moves, ai_rating, stop_event=self.stop_event, **search_options)
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def ponderhit(self, time_limit):
+        # A pondered move was played: the search keeps going, now with time_limit seconds left
+        if not self.done():
+            timer = threading.Timer(time_limit, self.stop_event.set)
+            timer.daemon = True
+            timer.start()
+
+    def cancel(self):
+        # The search notices the stop flag within a few hundred nodes; wait so searches never overlap.
+        self.stop_event.set()
+        self.thread.join()
+
+
+def pick_tablebase_move(game_state, valid_moves):
+    # Won endings are converted by the shortest mate, lost ones resisted for as long as possible
+    if probe_tablebase(game_state) is None:
+        return None
+    best_move, best_rank = None, None
+    for move in valid_moves:
+        game_state.make_move(move)
+        result = probe_tablebase(game_state)
+        game_state.undo_move()
+        outcome, plies = result if result is not None else (0, 0)  # bare kings after a capture
+        rank = (outcome, plies) if outcome < 0 else (1, 0) if outcome == 0 else (2, -plies)
+        if best_rank is None or rank < best_rank:
+            best_move, best_rank = move, rank
+    return best_move
+
+
+def tablebase_score(game_state, ply):
+    # From the side to move's point of view, like every score inside the search
+    result = probe_tablebase(game_state)
+    if result is None:
+        return None
+    outcome, plies = result
+    if outcome == 0:
+        return STALEMATE
+    # Nearer mates score higher so the search prefers them
+    score = TABLEBASE_WIN - ply - plies
+    return score if outcome > 0 else -score
+
+
+def score_to_table(score, ply):
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def has_non_pawn_material(game_state):
+    # Null-move pruning is unsound in king and pawn endings, where zugzwang is common
+    color = 'w' if game_state.white_turn else 'b'
+    return game_state.occupancy[color] != game_state.bitboards[color + 'K'] | game_state.bitboards[color + 'p']
+
+
+def principal_variation(game_state, table, max_length):
+    # Follows the stored best moves from the current position, leaving game_state unchanged
+    pv = []
+    for _ in range(max_length):
+        entry = table.probe(game_state.zobrist_key)
+        if entry is None or entry[3] is None:
+            break
+        move = next((m for m in game_state.generate_legal_moves() if m.move_id == entry[3]), None)
+        if move is None:
+            break
+        pv.append(move)
+        game_state.make_move(move)
+    for _ in pv:
+        game_state.undo_move()
+    return pv
+
+
+def search_root(game_state, valid_moves, depth, ai_rating, context, guess=None):
+    # Returns the score from White's point of view. guess is the previous iteration's score: deeper
+    # iterations start with a window around it and widen the window whenever the result falls outside.
+    side = 1 if game_state.white_turn else -1
+    delta = ASPIRATION_WINDOW
+    while True:
+        full_window = guess is None or depth < ASPIRATION_MIN_DEPTH or delta > ASPIRATION_LIMIT
+        if full_window:
+            alpha, beta = -CHECKMATE, CHECKMATE
+        else:
+            alpha, beta = guess * side - delta, guess * side + delta
+        score, move = search_root_window(game_state, valid_moves, depth, alpha, beta, ai_rating, context)
+        if full_window or alpha < score < beta:
+            return (None if score is None else score * side), move
+        delta *= 4
+
+
+def search_root_window(game_state, valid_moves, depth, alpha, beta, ai_rating, context):
+    original_alpha = alpha
+    best_score, best_move = None, None
+    hash_move_id = context.pv[0].move_id if context.pv else None
+    for index, move in enumerate(order_moves(list(valid_moves), hash_move_id, context, 0)):
+        game_state.make_move(move)
+        if index == 0:
+            score = -alpha_beta(game_state, depth - 1, -beta, -alpha, ai_rating, context, 1)
+        else:
+            score = -alpha_beta(game_state, depth - 1, -alpha - NULL_WINDOW, -alpha, ai_rating, context, 1)
+            if alpha < score < beta:
+                score = -alpha_beta(game_state, depth - 1, -beta, -alpha, ai_rating, context, 1)
+        game_state.undo_move()
+
+        if best_move is None or score > best_score:
+            best_score, best_move = score, move
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+
+    if best_move is not None:
+        flag = UPPER_BOUND if best_score <= original_alpha else LOWER_BOUND if best_score >= beta else EXACT
+        context.table.store(game_state.zobrist_key, depth, flag, best_score, best_move.move_id)
+        context.tt_stores += 1
+    return best_score, best_move
+
+
+def alpha_beta(game_state, depth, alpha, beta, ai_rating, context, ply, allow_null=True):
+    # Negamax: scores are from the side to move's point of view
+    context.nodes += 1
+    if context.nodes & 255 == 0:
+        context.check_budget()
+
+    # A single repetition already counts as a draw: whichever side it suits can repeat it again
+    if game_state.halfmove_clock >= 100 or game_state.repetitions() or game_state.insufficient_material():
+        return STALEMATE
+
+    known_score = tablebase_score(game_state, ply)
+    if known_score is not None:
+        return known_score
+
+    # Settle captures at the horizon
+    if depth <= 0:
+        return quiescence(game_state, alpha, beta, ai_rating, context, ply)
+
+    table = context.table
+    key = game_state.zobrist_key
+    entry = table.probe(key)
+    context.tt_probes += 1
+    hash_move_id = None
+    if entry is not None:
+        context.tt_hits += 1
+        entry_depth, flag, score, hash_move_id, _ = entry
+        if entry_depth >= depth:
+            score = score_from_table(score, ply)
+            if flag == EXACT:
+                return score
+            if flag == LOWER_BOUND:
+                alpha = max(alpha, score)
+            elif flag == UPPER_BOUND:
+                beta = min(beta, score)
+            if beta <= alpha:
+                return score
+
+    in_check = context.in_check(game_state)
+
+    # Null move: if passing still leaves us at or above beta, a real move almost certainly would too
+    if allow_null and not in_check and depth >= NULL_MOVE_MIN_DEPTH and abs(beta) < MATE_BOUND \
+            and has_non_pawn_material(game_state):
+        side = 1 if game_state.white_turn else -1
+        if context.evaluate(game_state, ai_rating) * side >= beta:
+            game_state.make_null_move()
+            score = -alpha_beta(game_state, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW,
+                                ai_rating, context, ply + 1, False)
+            game_state.undo_move()
+            if score >= beta:
+                return beta if score >= MATE_BOUND else score
+
+    valid_moves = context.legal_moves(game_state)
+    if not valid_moves:
+        return -(CHECKMATE - ply) if in_check else STALEMATE
+
+    # Without a stored move, fall back to the previous iteration's principal variation
+    if hash_move_id is None and ply < len(context.pv):
+        hash_move_id = context.pv[ply].move_id
+
+    original_alpha = alpha
+    best_score, best_move_id = None, None
+    killers = context.killers[min(ply, MAX_PLY - 1)]
+    for index, move in enumerate(order_moves(valid_moves, hash_move_id, context, ply)):
+        game_state.make_move(move)
+        if index == 0:
+            score = -alpha_beta(game_state, depth - 1, -beta, -alpha, ai_rating, context, ply + 1)
+        else:
+            # Principal variation search: prove the move is no better than alpha with a null window
+            reduction = 0
+            if depth >= LMR_MIN_DEPTH and index >= LMR_MIN_MOVES and not in_check and move.piece_taken == "--" \
+                    and not move.pawn_promotion and move.move_id not in killers \
+                    and not context.in_check(game_state):
+                reduction = 2 if index >= LMR_LATE_MOVES and depth >= LMR_DEEP_DEPTH else 1
+            score = -alpha_beta(game_state, depth - 1 - reduction, -alpha - NULL_WINDOW, -alpha,
+                                ai_rating, context, ply + 1)
+            if reduction and score > alpha:
+                score = -alpha_beta(game_state, depth - 1, -alpha - NULL_WINDOW, -alpha, ai_rating, context, ply + 1)
+            if alpha < score < beta:
+                score = -alpha_beta(game_state, depth - 1, -beta, -alpha, ai_rating, context, ply + 1)
+        game_state.undo_move()
+
+        if best_score is None or score > best_score:
+            best_score, best_move_id = score, move.move_id
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            context.beta_cutoffs += 1
+            context.first_move_cutoffs += index == 0
+            context.record_cutoff(move, depth, ply)
+            break
+
+    if best_score <= original_alpha:
+        flag = UPPER_BOUND
+    elif best_score >= beta:
+        flag = LOWER_BOUND
+    else:
+        flag = EXACT
+    table.store(key, depth, flag, score_to_table(best_score, ply), best_move_id)
+    context.tt_stores += 1
+    return best_score
+
+
+def quiescence(game_state, alpha, beta, ai_rating, context, ply):
+    context.nodes += 1
+    context.quiescence_nodes += 1
+    if context.nodes & 255 == 0:
+        context.check_budget()
+
+    # Evasions can extend a line of checks indefinitely, so the line is cut off at MAX_PLY
+    if ply >= MAX_PLY:
+        return context.evaluate(game_state, ai_rating) * (1 if game_state.white_turn else -1)
+
+    if context.in_check(game_state):
+        # No standing pat while in check: every evasion is searched
+        moves = context.quiescence_moves(game_state, True)
+        if not moves:
+            return -(CHECKMATE - ply)
+        best = -CHECKMATE
+        stand_pat = None
+    else:
+        stand_pat = context.evaluate(game_state, ai_rating) * (1 if game_state.white_turn else -1)
+        if stand_pat >= beta:
+            return stand_pat
+        best = stand_pat
+        alpha = max(alpha, stand_pat)
+        moves = context.quiescence_moves(game_state, False)
+
+    for move in order_moves(moves):
+        if stand_pat is not None:
+            gain = PIECE_VALUES[move.piece_taken[1]] + (8 if move.pawn_promotion else 0) + DELTA_MARGIN
+            if stand_pat + gain < alpha:
+                # still a bound: the skipped capture could have reached stand_pat + gain
+                best = max(best, stand_pat + gain)
+                continue
+        game_state.make_move(move)
+        score = -quiescence(game_state, -beta, -alpha, ai_rating, context, ply + 1)
+        game_state.undo_move()
+
+        best = max(best, score)
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+    return best
+
+
+def score_move(move, hash_move_id, killers, history):
+    if move.move_id == hash_move_id:
+        return HASH_MOVE_SCORE
+    if move.piece_taken != "--":
+        # Most valuable victim first, cheapest attacker breaking ties
+        return CAPTURE_SCORE + PIECE_VALUES[move.piece_taken[1]] * 10 - ATTACKER_RANKS[move.piece_moved[1]]
+    if move.pawn_promotion:
+        return PROMOTION_SCORE
+    if move.move_id == killers[0]:
+        return KILLER_SCORES[0]
+    if move.move_id == killers[1]:
+        return KILLER_SCORES[1]
+    return history.get(move.move_id, 0)
+
+
+def order_moves(moves, hash_move_id=None, context=None, ply=0):
+    # Selection rather than a full sort: after a cutoff the remaining moves are never ranked
+    if context is None:
+        killers, history = (None, None), {}
+    else:
+        killers = context.killers[min(ply, MAX_PLY - 1)]
+        history = context.history[moves[0].piece_moved[0]] if moves else {}
+    scores = [score_move(move, hash_move_id, killers, history) for move in moves]
+    for i in range(len(moves)):
+        best = max(range(i, len(moves)), key=scores.__getitem__)
+        if best != i:
+            moves[i], moves[best] = moves[best], moves[i]
+            scores[i], scores[best] = scores[best], scores[i]
+        yield moves[i]
 
 
-def evaluate_board(board, ai_rating=1200):
-    score = 0
-    for row in board:
-        for square in row:
-            if square != "--":
-                piece_type = square[1]
-                piece_value = piece_scores[piece_type]
-                if square[0] == 'w':
-                    score += piece_value
-                else:
-                    score -= piece_value
+def evaluate_board(game_state, ai_rating=1200):
+    # Material and piece-square totals are kept up to date by make_move/undo_move
+    score = game_state.material_score + game_state.positional_score / 100
 
     skill_factor = min(max(ai_rating, 800), 2000)
     noise = random.uniform(-1, 1) * (2000 - skill_factor) / 800
@@ -131,8 +766,12 @@ def pick_random_move(valid_moves):
 
 
 def update_and_save_ratings(result):
+    global white_player, black_player
+    if white_player is None:
+        ratings = load_ratings()
+        white_player, black_player = ratings["white"], ratings["black"]
 
     white_player.update(black_player.rating, result)
     black_player.update(white_player.rating, 1 - result)
-    save_ratings(white_player, black_player)
+    save_ratings(white_player, black_player, result=result)
     print(f"New Ratings — White: {white_player.get_rating()}, Black: {black_player.get_rating()}")
@@ -0,0 +1,212 @@
+import argparse
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+
+import Engine
+from Engine import Move
+
+BOOK_FILE = "book.bin"
+DEFAULT_MAX_PLY = 30
+
+# One record per (position, move): Zobrist key, from/to squares packed as from * 64 + to, weight.
+# Records are sorted by key so a lookup is a binary search straight over the mapped file.
+RECORD = struct.Struct("<QHH")
+MAX_WEIGHT = 0xFFFF
+
+_HEADER_LINE = re.compile(r"^\s*\[")
+_COMMENT = re.compile(r"\{[^}]*\}|;[^\n]*")
+_MOVE_NUMBER = re.compile(r"^\d+\.+")
+_RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+
+
+def encode_move(move):
+    return (move.start_row * 8 + move.start_col) << 6 | (move.end_row * 8 + move.end_col)
+
+
+def read_pgn_games(path):
+    # Yields (result, [san, ...]) for every game; headers, comments, NAGs and variations are dropped.
+    result, movetext = None, []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if _HEADER_LINE.match(line):
+                if movetext:
+                    yield result, _san_tokens(" ".join(movetext))
+                    movetext = []
+                if line.strip().startswith("[Result "):
+                    result = line.split('"')[1] if '"' in line else None
+                continue
+            movetext.append(line)
+    if movetext:
+        yield result, _san_tokens(" ".join(movetext))
+
+
+def _san_tokens(text):
+    text = _COMMENT.sub(" ", text)
+    # strip (possibly nested) variations from the inside out
+    previous = None
+    while previous != text:
+        previous = text
+        text = re.sub(r"\([^()]*\)", " ", text)
+    tokens = []
+    for token in text.split():
+        token = _MOVE_NUMBER.sub("", token)
+        if not token or token.startswith("$") or token in _RESULTS:
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def parse_san(san, legal_moves):
+    san = san.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        kingside = san.count("O") + san.count("0") == 2
+        for move in legal_moves:
+            if move.is_castling and (move.end_col > move.start_col) == kingside:
+                return move
+        return None
+
+    promotion = None
+    if "=" in san:
+        san, promotion = san.split("=", 1)
+    elif san and san[-1] in "QRBN" and san[0].islower():
+        san, promotion = san[:-1], san[-1]
+    if promotion is not None and promotion[:1] != "Q":
+        return None  # the engine only promotes to a queen
+
+    piece_type = san[0] if san and san[0] in "NBRQK" else "p"
+    body = (san[1:] if piece_type != "p" else san).replace("x", "")
+    if len(body) < 2 or body[-2] not in Move.files_to_cols or body[-1] not in Move.ranks_to_rows:
+        return None
+    end_row, end_col = Move.ranks_to_rows[body[-1]], Move.files_to_cols[body[-2]]
+    hint = body[:-2]
+
+    candidates = []
+    for move in legal_moves:
+        if move.piece_moved[1] != piece_type or (move.end_row, move.end_col) != (end_row, end_col):
+            continue
+        if any(h in Move.files_to_cols and Move.files_to_cols[h] != move.start_col for h in hint):
+            continue
+        if any(h in Move.ranks_to_rows and Move.ranks_to_rows[h] != move.start_row for h in hint):
+            continue
+        candidates.append(move)
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def build_book(pgn_paths, output_path=BOOK_FILE, max_ply=DEFAULT_MAX_PLY, min_games=1):
+    # Weights count a win for the side to move twice and a draw once, so losing moves fade out.
+    counts = {}
+    games = 0
+    for path in pgn_paths:
+        for result, sans in read_pgn_games(path):
+            game_state = Engine.ChessState()
+            for san in sans[:max_ply]:
+                move = parse_san(san, game_state.generate_legal_moves())
+                if move is None:
+                    break
+                score = {"1-0": 2 if game_state.white_turn else 0,
+                         "0-1": 0 if game_state.white_turn else 2}.get(result, 1)
+                entry_key = (game_state.zobrist_key, encode_move(move))
+                games_seen, weight = counts.get(entry_key, (0, 0))
+                counts[entry_key] = (games_seen + 1, weight + score)
+                game_state.make_move(move)
+            games += 1
+
+    records = sorted(
+        (key, move_code, min(MAX_WEIGHT, max(1, weight)))
+        for (key, move_code), (games_seen, weight) in counts.items()
+        if games_seen >= min_games
+    )
+    with open(output_path, "wb") as f:
+        for record in records:
+            f.write(RECORD.pack(*record))
+    return games, len(records)
+
+
+class OpeningBook:
+    def __init__(self, path=BOOK_FILE):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size % RECORD.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a book file (size {size} is not a multiple of {RECORD.size})")
+        self.count = size // RECORD.size
+        # Read-only mapping: every engine process opening the same book shares its pages
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def _key_at(self, index):
+        return RECORD.unpack_from(self._map, index * RECORD.size)[0]
+
+    def lookup(self, key):
+        if self._map is None:
+            return []
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.count:
+            entry_key, move_code, weight = RECORD.unpack_from(self._map, low * RECORD.size)
+            if entry_key != key:
+                break
+            entries.append((move_code, weight))
+            low += 1
+        return entries
+
+    def choose_move(self, game_state, valid_moves, ai_rating=1200):
+        by_code = {encode_move(move): move for move in valid_moves}
+        candidates = [(by_code[code], weight) for code, weight in self.lookup(game_state.zobrist_key)
+                      if code in by_code]
+        if not candidates:
+            return None
+        # Stronger ratings lean harder on the most successful moves, weaker ones spread out
+        exponent = min(2.0, max(0.25, ai_rating / 1000))
+        moves = [move for move, _ in candidates]
+        weights = [weight ** exponent for _, weight in candidates]
+        return random.choices(moves, weights=weights)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and probe the opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build a book from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("-o", "--output", default=BOOK_FILE)
+    build.add_argument("--max-ply", type=int, default=DEFAULT_MAX_PLY)
+    build.add_argument("--min-games", type=int, default=1, help="drop moves seen in fewer games")
+
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("--book", default=BOOK_FILE)
+    probe.add_argument("--fen")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        games, records = build_book(args.pgn, args.output, args.max_ply, args.min_games)
+        print(f"{games} games, {records} positions/moves written to {args.output}")
+        return 0
+
+    book = OpeningBook(args.book)
+    game_state = Engine.ChessState(args.fen)
+    by_code = {encode_move(move): move for move in game_state.generate_legal_moves()}
+    for code, weight in sorted(book.lookup(game_state.zobrist_key), key=lambda entry: -entry[1]):
+        move = by_code.get(code)
+        print(f"{move.get_notation() if move else code}: {weight}")
+    book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,8 +5,10 @@ SCREEN_WIDTH = SCREEN_HEIGHT = 512
 BOARD_TILES = 8
 TILE_SIZE = SCREEN_HEIGHT // BOARD_TILES
 FPS_LIMIT = 30
+PONDER = True  # search the expected reply while the human is thinking
 PIECE_IMAGES = {}
-tile_colors = [pg.Color("white"), pg.Color("gray")]
+tile_colors = [pg.Color("darkGreen"), pg.Color("lightyellow")]
+HIGHLIGHT_ALPHA = 100
 
 
 def load_piece_images():
@@ -30,6 +32,7 @@ def main():
     animate_move = False
 
     load_piece_images()
+    renderer = BoardRenderer(window)
     running = True
     selected_square = ()
     click_history = []
@@ -38,6 +41,9 @@ def main():
     human_white = True
     human_black = False
     undo = False
+    ai_search = None
+    ponder, ponder_move = None, None
+    ponder_pending = False
 
     players = Rating.load_ratings() if hasattr(Rating, "load_ratings") else None
     if players:
@@ -53,9 +59,21 @@ def main():
     while running:
         is_human_turn = (game_state.white_turn and human_white) or (not game_state.white_turn and human_black)
 
-        for event in pg.event.get():
+        if ai_search is None and (match_over or is_human_turn) and renderer.up_to_date():
+            # Nothing can change until the user acts, so sleep until the next event
+            events = [pg.event.wait()] + pg.event.get()
+        else:
+            events = pg.event.get()
+
+        for event in events:
             if event.type == pg.QUIT:
                 running = False
+                if ai_search is not None:
+                    ai_search.cancel()
+                    ai_search = None
+                if ponder is not None:
+                    ponder.cancel()
+                    ponder = None
 
             elif event.type == pg.MOUSEBUTTONDOWN:
                 if not match_over and is_human_turn:
@@ -76,6 +94,15 @@ def main():
                         for i in range(len(valid_moves)):
                             if move == valid_moves[i]:
                                 game_state.make_move(valid_moves[i])
+                                if ponder is not None:
+                                    if valid_moves[i] == ponder_move:
+                                        # Predicted correctly: the ponder search becomes the real one
+                                        ai_player = white_player if game_state.white_turn else black_player
+                                        ai_search = ponder
+                                        ai_search.ponderhit(AI.get_ai_parameters(ai_player.get_rating())["time"])
+                                    else:
+                                        ponder.cancel()
+                                    ponder = None
                                 move_done = True
                                 animate_move = True
                                 selected_square = ()
@@ -86,6 +113,12 @@ def main():
 
             elif event.type == pg.KEYDOWN:
                 if event.key == pg.K_z:
+                    if ai_search is not None:
+                        ai_search.cancel()
+                        ai_search = None
+                    if ponder is not None:
+                        ponder.cancel()
+                        ponder = None
                     game_state.undo_move()
 
                     if len(game_state.move_history) > 0 and (human_white & human_black) == False:
@@ -99,6 +132,12 @@ def main():
 
                     rating_updated = False
                 elif event.key == pg.K_r:
+                    if ai_search is not None:
+                        ai_search.cancel()
+                        ai_search = None
+                    if ponder is not None:
+                        ponder.cancel()
+                        ponder = None
 
                     game_state = Engine.ChessState()
                     valid_moves = game_state.get_legal_moves()
@@ -110,24 +149,42 @@ def main():
                     undo = False
                     rating_updated = False
 
+            elif event.type == pg.VIDEOEXPOSE:
+                renderer.invalidate()
+
         if not match_over and not is_human_turn and not undo:
-            ai_player = white_player if game_state.white_turn else black_player
-            ai_move = AI.pick_best_move(game_state, valid_moves, ai_player.get_rating())
-            if ai_move is None:
-                ai_move = AI.pick_random_move(valid_moves)
-            game_state.make_move(ai_move)
-            move_done = True
-            animate_move = True
+            # The search runs on a worker thread; keep rendering and handling events until it reports back
+            if ai_search is None:
+                ai_player = white_player if game_state.white_turn else black_player
+                ai_search = AI.SearchWorker(game_state, valid_moves, ai_player.get_rating())
+            elif ai_search.done():
+                ai_move = ai_search.result
+                ai_search = None
+                if ai_move is None:
+                    ai_move = AI.pick_random_move(valid_moves)
+                game_state.make_move(ai_move)
+                move_done = True
+                animate_move = True
+                ponder_pending = PONDER and human_white != human_black
 
         undo = False
         if move_done:
             if animate_move:
                 animate_piece_movement(game_state.move_history[-1], window, game_state, clock)
+                renderer.invalidate()
             valid_moves = game_state.get_legal_moves()
             move_done = False
             animate_move = False
 
-        render_game(window, game_state, valid_moves, selected_square, white_player, black_player)
+        if ponder_pending:
+            ponder_pending = False
+            if valid_moves:
+                ai_player = black_player if game_state.white_turn else white_player
+                ponder, ponder_move = start_ponder(game_state, ai_player.get_rating())
+
+        dirty_rects = renderer.render(game_state, valid_moves, selected_square)
+        if dirty_rects:
+            pg.display.update(dirty_rects)
 
         if game_state.checkmate:
             match_over = True
@@ -143,9 +200,8 @@ def main():
                     result_text = "White wins by checkmate!"
 
                 if hasattr(Rating, "save_ratings"):
-                    Rating.save_ratings(white_player, black_player)
+                    Rating.save_ratings(white_player, black_player, result=0 if game_state.white_turn else 1)
 
-                window.fill(pg.Color("white"))
                 draw_board(window)
                 draw_pieces(window, game_state.board)
                 draw_text(window, result_text, white_player.get_rating(), black_player.get_rating())
@@ -153,6 +209,7 @@ def main():
 
 
                 pg.time.wait(4000)
+                renderer.invalidate()
 
                 rating_updated = True
 
@@ -164,54 +221,106 @@ def main():
                 black_player.update(white_player.get_rating(), 0.5)
 
                 if hasattr(Rating, "save_ratings"):
-                    Rating.save_ratings(white_player, black_player)
+                    Rating.save_ratings(white_player, black_player, result=0.5)
 
-                window.fill(pg.Color("white"))
                 draw_board(window)
                 draw_pieces(window, game_state.board)
-                draw_text(window, "Stalemate", white_player.get_rating(), black_player.get_rating())
+                draw_text(window, game_state.draw_reason.capitalize(), white_player.get_rating(), black_player.get_rating())
                 pg.display.flip()
 
                 pg.time.wait(4000)
+                renderer.invalidate()
 
                 rating_updated = True
 
-
         clock.tick(FPS_LIMIT)
-        pg.display.flip()
 
 
-def highlight_tiles(window, game_state, valid_moves, selected_square):
+def start_ponder(game_state, ai_rating):
+    # Guess the human's reply from the hash table and search the position after it in the background
+    expected = AI.principal_variation(game_state, AI.transposition_table, 1)
+    if not expected:
+        return None, None
+    game_state.make_move(expected[0])
+    replies = game_state.get_legal_moves()
+    # SearchWorker copies the position up front, so it can be undone straight away
+    worker = AI.SearchWorker(game_state, replies, ai_rating, params={"time": None}) if replies else None
+    game_state.undo_move()
+    return worker, expected[0] if worker is not None else None
+
+
+def tile_highlights(game_state, valid_moves, selected_square):
+    # Maps highlighted squares to the overlay drawn on them
+    highlights = {}
     if selected_square != ():
         row, col = selected_square
 
         if game_state.board[row][col] != "--" and game_state.board[row][col][0] == ('w' if game_state.white_turn else 'b'):
-            surface = pg.Surface((TILE_SIZE, TILE_SIZE))
-            surface.set_alpha(100)
-            surface.fill(pg.Color('blue'))
-            window.blit(surface, (col * TILE_SIZE, row * TILE_SIZE))
-
-            yellow = pg.Surface((TILE_SIZE, TILE_SIZE))
-            yellow.set_alpha(100)
-            yellow.fill(pg.Color('yellow'))
+            highlights[(row, col)] = "selected"
             for move in valid_moves:
                 if move.start_row == row and move.start_col == col:
-                    window.blit(yellow, (move.end_col * TILE_SIZE, move.end_row * TILE_SIZE))
-
-
-def render_game(window, game_state, valid_moves, selected_square, white_player, black_player):
-    draw_board(window)
-    highlight_tiles(window, game_state, valid_moves, selected_square)
-    draw_pieces(window, game_state.board)
+                    highlights[(move.end_row, move.end_col)] = "target"
+    return highlights
+
+
+class BoardRenderer:
+    # Remembers what every tile shows and redraws only the tiles whose piece or highlight changed
+    def __init__(self, window):
+        self.window = window
+        self.overlays = {"selected": make_overlay(pg.Color('blue')), "target": make_overlay(pg.Color('yellow'))}
+        self.tiles = [None] * (BOARD_TILES * BOARD_TILES)
+
+    def invalidate(self):
+        # Something else drew over the window; repaint everything on the next render
+        self.tiles = [None] * (BOARD_TILES * BOARD_TILES)
+
+    def up_to_date(self):
+        return None not in self.tiles
+
+    def render(self, game_state, valid_moves, selected_square):
+        highlights = tile_highlights(game_state, valid_moves, selected_square)
+        board_surface = get_board_surface()
+        dirty_rects = []
+        for r in range(BOARD_TILES):
+            for c in range(BOARD_TILES):
+                tile = (game_state.board[r][c], highlights.get((r, c)))
+                if self.tiles[r * BOARD_TILES + c] == tile:
+                    continue
+                self.tiles[r * BOARD_TILES + c] = tile
+                rect = pg.Rect(c * TILE_SIZE, r * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                self.window.blit(board_surface, rect, rect)
+                if tile[1] is not None:
+                    self.window.blit(self.overlays[tile[1]], rect)
+                if tile[0] != "--":
+                    self.window.blit(PIECE_IMAGES[tile[0]], rect)
+                dirty_rects.append(rect)
+        return dirty_rects
+
+
+def make_overlay(color):
+    surface = pg.Surface((TILE_SIZE, TILE_SIZE))
+    surface.set_alpha(HIGHLIGHT_ALPHA)
+    surface.fill(color)
+    return surface
+
+
+_board_surface = None
+
+
+def get_board_surface():
+    # The tiles never change, so they are drawn once and blitted from then on
+    global _board_surface
+    if _board_surface is None:
+        _board_surface = pg.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        for r in range(BOARD_TILES):
+            for c in range(BOARD_TILES):
+                color = tile_colors[(r + c) % 2]
+                pg.draw.rect(_board_surface, color, pg.Rect(c * TILE_SIZE, r * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+    return _board_surface
 
 
 def draw_board(window):
-    global tile_colors
-    tile_colors = [pg.Color("darkGreen"), pg.Color("lightyellow")]
-    for r in range(BOARD_TILES):
-        for c in range(BOARD_TILES):
-            color = tile_colors[(r + c) % 2]
-            pg.draw.rect(window, color, pg.Rect(c * TILE_SIZE, r * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+    window.blit(get_board_surface(), (0, 0))
 
 
 def draw_pieces(window, board):
@@ -223,7 +332,6 @@ def draw_pieces(window, board):
 
 
 def animate_piece_movement(move, window, game_state, clock):
-    global tile_colors
     d_row = move.end_row - move.start_row
     d_col = move.end_col - move.start_col
     frames_per_tile = 3
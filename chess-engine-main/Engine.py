@@ -1,7 +1,178 @@
 # Engine.py
+import random
+
+# Squares are numbered 0..63 as row * 8 + col, so bit 0 is a8 and bit 63 is h1.
+def _square_bit(r, c):
+    return 1 << (r * 8 + c)
+
+
+def _leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                attacks |= _square_bit(r + dr, c + dc)
+        table.append(attacks)
+    return table
+
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        ray = 0
+        r, c = r + dr, c + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            ray |= _square_bit(r, c)
+            r, c = r + dr, c + dc
+        table.append(ray)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_table([(-2,-1), (-1,-2), (-2,1), (-1,2), (2,1), (1,2), (2,-1), (1,-2)])
+KING_ATTACKS = _leaper_table([(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)])
+PAWN_ATTACKS = {
+    'w': _leaper_table([(-1,-1), (-1,1)]),
+    'b': _leaper_table([(1,-1), (1,1)])
+}
+
+# (ray table, True if the ray runs towards higher square numbers)
+ROOK_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in [(1,0), (-1,0), (0,1), (0,-1)]]
+BISHOP_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in [(1,1), (-1,1), (1,-1), (-1,-1)]]
+QUEEN_RAYS = ROOK_RAYS + BISHOP_RAYS
+ALL_SQUARES = (1 << 64) - 1
+DARK_SQUARES = sum(1 << sq for sq in range(64) if (sq // 8 + sq % 8) % 2)
+
+
+def _between_table():
+    table = [[0] * 64 for _ in range(64)]
+    for table_rays, positive in QUEEN_RAYS:
+        for a in range(64):
+            ray = table_rays[a]
+            while ray:
+                lsb = ray & -ray
+                b = lsb.bit_length() - 1
+                table[a][b] = table_rays[a] & ~table_rays[b] & ~lsb
+                ray ^= lsb
+    return table
+
+
+# BETWEEN[a][b] holds the squares strictly between two aligned squares, 0 otherwise
+BETWEEN = _between_table()
+
+# Zobrist keys are drawn from a fixed seed so hashes agree across processes and runs.
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = {color + piece_type: [_zobrist_random.getrandbits(64) for _ in range(64)]
+                  for color in "wb" for piece_type in "pRNBQK"}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_ENPASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+
+PIECE_VALUES = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+
+# Piece-square bonuses in hundredths of a pawn, laid out from White's side with a8 first.
+PIECE_SQUARE_TABLES = {
+    "p": [
+          0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    "N": [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    "B": [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    "R": [
+          0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0,
+    ],
+    "Q": [
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+    ],
+    "K": [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20,
+    ],
+}
+
+# Signed from White's point of view, so make_move/undo_move can keep running totals by delta.
+# Positional scores stay in hundredths of a pawn so the running total is an exact integer.
+MATERIAL_SCORES = {}
+POSITIONAL_SCORES = {}
+for _piece_type, _table in PIECE_SQUARE_TABLES.items():
+    MATERIAL_SCORES["w" + _piece_type] = PIECE_VALUES[_piece_type]
+    MATERIAL_SCORES["b" + _piece_type] = -PIECE_VALUES[_piece_type]
+    POSITIONAL_SCORES["w" + _piece_type] = list(_table)
+    POSITIONAL_SCORES["b" + _piece_type] = [-_table[(7 - sq // 8) * 8 + sq % 8] for sq in range(64)]
+
+
+def slider_attacks(sq, occupied, rays):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+
+# Irreversible state saved per ply by make_move, packed into one int:
+# bits 0-3 castle rights mask, 4-10 en passant square + 1 (0 = none),
+# 11-14 captured piece code, 15-24 halfmove clock, 25 and up the Zobrist key.
+PIECE_CODES = ["--", "wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
+PIECE_CODE_OF = {piece: code for code, piece in enumerate(PIECE_CODES)}
+EP_SHIFT, CAPTURE_SHIFT, HALFMOVE_SHIFT, KEY_SHIFT = 4, 11, 15, 25
+
+
 class ChessState:
-    def __init__(self):
-        self.board = [
+    def __init__(self, fen=None):
+        board = [
             ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
             ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
             ["--", "--", "--", "--", "--", "--", "--", "--"],
@@ -11,6 +182,7 @@ class ChessState:
             ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
         ]
+        self.load_board(board)
 
         self.move_generators = {
             'p': self.get_pawn_moves,
@@ -27,51 +199,239 @@ class ChessState:
         self.black_king_pos = (0, 4)
         self.checkmate = False
         self.stalemate = False
+        # why get_legal_moves found the game drawn: "stalemate", "insufficient material",
+        # "fifty-move rule" or "threefold repetition"; stalemate is set for all of them
+        self.draw_reason = None
         self.enpassant_target = ()
         self.castle_rights = CastleRights(True, True, True, True)
+        self.halfmove_clock = 0
+        # plies played before move_history starts, so FEN move numbers survive a load
+        self.start_ply = 0
+        self.state_stack = []
+        self.zobrist_key = self.compute_zobrist_key()
+
+        if fen is not None:
+            self.load_fen(fen)
+
+    def load_fen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"FEN needs at least 4 fields: {fen!r}")
+        placement, side, castling, enpassant = fields[:4]
+
+        board = []
+        for rank in placement.split('/'):
+            row = []
+            for symbol in rank:
+                if symbol.isdigit():
+                    row.extend(["--"] * int(symbol))
+                elif symbol.upper() in "PRNBQK":
+                    color = 'w' if symbol.isupper() else 'b'
+                    row.append(color + ('p' if symbol in "Pp" else symbol.upper()))
+                else:
+                    raise ValueError(f"Bad piece {symbol!r} in FEN: {fen!r}")
+            if len(row) != 8:
+                raise ValueError(f"Rank {rank!r} does not have 8 squares: {fen!r}")
+            board.append(row)
+        if len(board) != 8 or side not in ("w", "b"):
+            raise ValueError(f"Bad FEN: {fen!r}")
+        if castling != "-" and (not castling or set(castling) - set("KQkq")):
+            raise ValueError(f"Bad castling field in FEN: {fen!r}")
+        # the square behind a pawn the opponent just pushed: rank 6 with White to move, rank 3 with Black
+        if enpassant != "-" and (len(enpassant) != 2 or enpassant[0] not in Move.files_to_cols
+                                 or enpassant[1] != ("6" if side == "w" else "3")):
+            raise ValueError(f"Bad en passant square in FEN: {fen!r}")
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Bad move counters in FEN: {fen!r}") from None
+
+        self.load_board(board)
+        if self.bitboards["wK"].bit_count() != 1 or self.bitboards["bK"].bit_count() != 1:
+            raise ValueError(f"FEN needs exactly one king per side: {fen!r}")
+        white_king = self.bitboards["wK"].bit_length() - 1
+        black_king = self.bitboards["bK"].bit_length() - 1
+        self.white_king_pos = (white_king >> 3, white_king & 7)
+        self.black_king_pos = (black_king >> 3, black_king & 7)
+
+        self.white_turn = side == "w"
+        self.move_history = []
+        self.checkmate = False
+        self.stalemate = False
+        self.draw_reason = None
+        # A right only survives if its king and rook are still on their home squares
+        white_home, black_home = board[7][4] == "wK", board[0][4] == "bK"
+        self.castle_rights = CastleRights('K' in castling and white_home and board[7][7] == "wR",
+                                          'k' in castling and black_home and board[0][7] == "bR",
+                                          'Q' in castling and white_home and board[7][0] == "wR",
+                                          'q' in castling and black_home and board[0][0] == "bR")
+        self.halfmove_clock = halfmove_clock
+        self.start_ply = max(0, fullmove_number - 1) * 2 + (0 if self.white_turn else 1)
+        self.state_stack = []
+        self.enpassant_target = ()
+        self.zobrist_key = self.compute_zobrist_key()
+        if enpassant != "-":
+            r, c = Move.ranks_to_rows[enpassant[1]], Move.files_to_cols[enpassant[0]]
+            step = 1 if self.white_turn else -1
+            # ignored unless it fits a double push: the pushed pawn in front, both squares it crossed empty
+            if board[r + step][c] == ("bp" if self.white_turn else "wp") and board[r][c] == "--" \
+                    and board[r - step][c] == "--":
+                self._set_enpassant_target(r, c)
+
+    def get_fen(self):
+        ranks = []
+        for row in self.board:
+            rank, empty = "", 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                symbol = 'P' if piece[1] == 'p' else piece[1]
+                rank += symbol if piece[0] == 'w' else symbol.lower()
+            ranks.append(rank + (str(empty) if empty else ""))
+
+        rights = self.castle_rights
+        castling = ("K" if rights.wks else "") + ("Q" if rights.wqs else "") + \
+                   ("k" if rights.bks else "") + ("q" if rights.bqs else "")
+        if self.enpassant_target:
+            enpassant = Move.cols_to_files[self.enpassant_target[1]] + Move.rows_to_ranks[self.enpassant_target[0]]
+        else:
+            enpassant = "-"
+        fullmove_number = (self.start_ply + len(self.move_history)) // 2 + 1
+        return " ".join(["/".join(ranks), "w" if self.white_turn else "b", castling or "-", enpassant,
+                         str(self.halfmove_clock), str(fullmove_number)])
+
+    def compute_zobrist_key(self):
+        key = 0
+        for piece, pieces in self.bitboards.items():
+            while pieces:
+                lsb = pieces & -pieces
+                key ^= ZOBRIST_PIECES[piece][lsb.bit_length() - 1]
+                pieces ^= lsb
+        if not self.white_turn:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.castle_rights.mask()]
+        if self.enpassant_target:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_target[1]]
+        return key
+
+    def load_board(self, board):
+        self.board = [["--"] * 8 for _ in range(8)]
+        self.bitboards = {color + piece_type: 0 for color in "wb" for piece_type in "pRNBQK"}
+        self.occupancy = {'w': 0, 'b': 0}
+        self.occupied = 0
+        self.piece_counts = dict.fromkeys(self.bitboards, 0)
+        self.zobrist_key = 0
+        self.material_score = 0
+        self.positional_score = 0
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] != "--":
+                    self._place_piece(r, c, board[r][c])
+
+    def _place_piece(self, r, c, piece):
+        bit = _square_bit(r, c)
+        self.board[r][c] = piece
+        self.bitboards[piece] |= bit
+        self.occupancy[piece[0]] |= bit
+        self.occupied |= bit
+        self.piece_counts[piece] += 1
+        self.zobrist_key ^= ZOBRIST_PIECES[piece][r * 8 + c]
+        self.material_score += MATERIAL_SCORES[piece]
+        self.positional_score += POSITIONAL_SCORES[piece][r * 8 + c]
+
+    def _remove_piece(self, r, c):
+        piece = self.board[r][c]
+        if piece == "--":
+            return
+        mask = ~_square_bit(r, c)
+        self.board[r][c] = "--"
+        self.bitboards[piece] &= mask
+        self.occupancy[piece[0]] &= mask
+        self.occupied &= mask
+        self.piece_counts[piece] -= 1
+        self.zobrist_key ^= ZOBRIST_PIECES[piece][r * 8 + c]
+        self.material_score -= MATERIAL_SCORES[piece]
+        self.positional_score -= POSITIONAL_SCORES[piece][r * 8 + c]
+
+    def make_move(self, move):
+        enpassant_code = 0
+        if self.enpassant_target:
+            enpassant_code = self.enpassant_target[0] * 8 + self.enpassant_target[1] + 1
+        self.state_stack.append(
+            self.castle_rights.mask()
+            | enpassant_code << EP_SHIFT
+            | PIECE_CODE_OF[move.piece_taken] << CAPTURE_SHIFT
+            | min(self.halfmove_clock, 1023) << HALFMOVE_SHIFT
+            | self.zobrist_key << KEY_SHIFT
+        )
+        if move.piece_moved[1] == 'p' or move.piece_taken != "--":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
 
-        self.castle_rights_log = [
-            CastleRights(self.castle_rights.wks, self.castle_rights.bks,
-                         self.castle_rights.wqs, self.castle_rights.bqs)
-        ]
-
-    def make_move(self, move, testing=False):
-        self.board[move.start_row][move.start_col] = "--"
-        self.board[move.end_row][move.end_col] = move.piece_moved
+        self._remove_piece(move.start_row, move.start_col)
+        if move.is_enpassant:
+            self._remove_piece(move.start_row, move.end_col)
+        else:
+            self._remove_piece(move.end_row, move.end_col)
+        if move.pawn_promotion:
+            self._place_piece(move.end_row, move.end_col, move.piece_moved[0] + 'Q')
+        else:
+            self._place_piece(move.end_row, move.end_col, move.piece_moved)
         self.move_history.append(move)
         self.white_turn = not self.white_turn
+        self.zobrist_key ^= ZOBRIST_BLACK_TO_MOVE
 
         if move.piece_moved == "wK":
             self.white_king_pos = (move.end_row, move.end_col)
         elif move.piece_moved == "bK":
             self.black_king_pos = (move.end_row, move.end_col)
 
-        if move.pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + 'Q'
-
-        if move.is_enpassant:
-            self.board[move.start_row][move.end_col] = "--"
-
+        if self.enpassant_target:
+            self.zobrist_key ^= ZOBRIST_ENPASSANT[self.enpassant_target[1]]
+        self.enpassant_target = ()
         if move.piece_moved[1] == 'p' and abs(move.start_row - move.end_row) == 2:
-            self.enpassant_target = ((move.start_row + move.end_row) // 2, move.start_col)
-        else:
-            self.enpassant_target = ()
+            self._set_enpassant_target((move.start_row + move.end_row) // 2, move.start_col)
 
         if move.is_castling:
             if move.end_col - move.start_col == 2:  # kingside
-                self.board[move.end_row][move.end_col - 1] = self.board[move.end_row][move.end_col + 1]
-                self.board[move.end_row][move.end_col + 1] = "--"
+                self._move_rook(move.end_row, move.end_col + 1, move.end_col - 1)
             elif move.end_col - move.start_col == -2:  # queenside
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 2]
-                self.board[move.end_row][move.end_col - 2] = "--"
-
-        if not testing:
-            self.update_castle_rights(move)
-
-        self.castle_rights_log.append(
-            CastleRights(self.castle_rights.wks, self.castle_rights.bks,
-                        self.castle_rights.wqs, self.castle_rights.bqs)
+                self._move_rook(move.end_row, move.end_col - 2, move.end_col + 1)
+
+        self.zobrist_key ^= ZOBRIST_CASTLING[self.castle_rights.mask()]
+        self.update_castle_rights(move)
+        self.zobrist_key ^= ZOBRIST_CASTLING[self.castle_rights.mask()]
+
+    def make_null_move(self):
+        # Passes the turn for the search's null-move pruning; recorded as None in move_history
+        enpassant_code = 0
+        if self.enpassant_target:
+            enpassant_code = self.enpassant_target[0] * 8 + self.enpassant_target[1] + 1
+        self.state_stack.append(
+            self.castle_rights.mask()
+            | enpassant_code << EP_SHIFT
+            | min(self.halfmove_clock, 1023) << HALFMOVE_SHIFT
+            | self.zobrist_key << KEY_SHIFT
         )
+        if self.enpassant_target:
+            self.zobrist_key ^= ZOBRIST_ENPASSANT[self.enpassant_target[1]]
+            self.enpassant_target = ()
+        # a line through a pass is no real repetition, so repetitions() looks back no further
+        self.halfmove_clock = 0
+        self.move_history.append(None)
+        self.white_turn = not self.white_turn
+        self.zobrist_key ^= ZOBRIST_BLACK_TO_MOVE
+
+    def _move_rook(self, r, from_col, to_col):
+        rook = self.board[r][from_col]
+        self._remove_piece(r, from_col)
+        self._place_piece(r, to_col, rook)
 
     def update_castle_rights(self, move):
         if move.piece_moved == 'wK':
@@ -108,85 +468,174 @@ class ChessState:
         if len(self.move_history) == 0:
             return
         move = self.move_history.pop()
+        state = self.state_stack.pop()
+        if move is None:
+            self._undo_null_move(state)
+            return
 
-        self.board[move.start_row][move.start_col] = move.piece_moved
-        self.board[move.end_row][move.end_col] = move.piece_taken
+        self._remove_piece(move.end_row, move.end_col)
+        self._place_piece(move.start_row, move.start_col, move.piece_moved)
+        captured = PIECE_CODES[state >> CAPTURE_SHIFT & 15]
+        if move.is_enpassant:
+            self._place_piece(move.start_row, move.end_col, captured)
+        elif captured != "--":
+            self._place_piece(move.end_row, move.end_col, captured)
         self.white_turn = not self.white_turn
 
-
         if move.piece_moved == 'wK':
             self.white_king_pos = (move.start_row, move.start_col)
         elif move.piece_moved == 'bK':
             self.black_king_pos = (move.start_row, move.start_col)
 
-        if move.pawn_promotion:
-            self.board[move.start_row][move.start_col] = move.piece_moved[0] + 'p'
-
- 
-        if move.is_enpassant:
-            self.board[move.end_row][move.end_col] = "--"
-            self.board[move.start_row][move.end_col] = move.piece_taken
-
-
-        if len(self.castle_rights_log) > 0:
-            self.castle_rights_log.pop()
-            if len(self.castle_rights_log) > 0:
-                last = self.castle_rights_log[-1]
-                self.castle_rights = CastleRights(last.wks, last.bks, last.wqs, last.bqs)
-
-
         if move.is_castling:
-            if move.end_col - move.start_col == 2:  
-                self.board[move.end_row][move.end_col + 1] = self.board[move.end_row][move.end_col - 1]
-                self.board[move.end_row][move.end_col - 1] = "--"
-            elif move.end_col - move.start_col == -2:  
-                self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
-                self.board[move.end_row][move.end_col + 1] = "--"
-
-        self.enpassant_target = ()
+            if move.end_col - move.start_col == 2:
+                self._move_rook(move.end_row, move.end_col - 1, move.end_col + 1)
+            elif move.end_col - move.start_col == -2:
+                self._move_rook(move.end_row, move.end_col + 1, move.end_col - 2)
+
+        self.castle_rights.set_mask(state & 15)
+        enpassant_code = state >> EP_SHIFT & 127
+        if enpassant_code:
+            self.enpassant_target = ((enpassant_code - 1) >> 3, (enpassant_code - 1) & 7)
+        else:
+            self.enpassant_target = ()
+        self.halfmove_clock = state >> HALFMOVE_SHIFT & 1023
+        self.zobrist_key = state >> KEY_SHIFT
 
         self.checkmate = False
         self.stalemate = False
+        self.draw_reason = None
+
+    def _undo_null_move(self, state):
+        enpassant_code = state >> EP_SHIFT & 127
+        if enpassant_code:
+            self.enpassant_target = ((enpassant_code - 1) >> 3, (enpassant_code - 1) & 7)
+        self.halfmove_clock = state >> HALFMOVE_SHIFT & 1023
+        self.zobrist_key = state >> KEY_SHIFT
+        self.white_turn = not self.white_turn
 
     def get_legal_moves(self):
-        temp_enpassant = self.enpassant_target
-        temp_rights = CastleRights(self.castle_rights.wks, self.castle_rights.bks,
-                                   self.castle_rights.wqs, self.castle_rights.bqs)
-
-        moves = self.get_all_moves()
-        if self.white_turn:
-            self.add_castling_moves(self.white_king_pos[0], self.white_king_pos[1], moves)
+        # Empty once the game is over, whether by checkmate, stalemate or one of the drawing rules
+        moves = self.generate_legal_moves()
+        self.checkmate = not moves and self.in_check()
+        if moves:
+            self.draw_reason = self.drawn_by_rule()
         else:
-            self.add_castling_moves(self.black_king_pos[0], self.black_king_pos[1], moves)
-
-
-        for i in range(len(moves) - 1, -1, -1):
-            self.make_move(moves[i], testing=True)
-            self.white_turn = not self.white_turn
-            if self.in_check():
-                moves.remove(moves[i])
-            self.white_turn = not self.white_turn
-            self.undo_move()
-        
-        pieces_alive = [piece for row in self.board for piece in row if piece != "--"]
-        if pieces_alive == ["wK", "bK"] or set(pieces_alive) == {"wK", "bK"}:
-            self.stalemate = True
-            self.checkmate = False
-            return []
-
-        if len(moves) == 0:
-            if self.in_check():
-                self.checkmate = True
-            else:
-                self.stalemate = True
+            self.draw_reason = None if self.checkmate else "stalemate"
+        self.stalemate = self.draw_reason is not None
+        return [] if self.stalemate else moves
+
+    def drawn_by_rule(self):
+        if self.insufficient_material():
+            return "insufficient material"
+        if self.halfmove_clock >= 100:
+            return "fifty-move rule"
+        if self.repetitions() >= 2:
+            return "threefold repetition"
+        return None
+
+    def repetitions(self):
+        # Earlier occurrences of the current position, looking back only to the last capture or pawn move
+        stack = self.state_stack
+        key = self.zobrist_key
+        count = 0
+        for ply in range(len(stack) - 2, max(len(stack) - self.halfmove_clock, 0) - 1, -2):
+            if stack[ply] >> KEY_SHIFT == key:
+                count += 1
+        return count
+
+    def insufficient_material(self):
+        counts = self.piece_counts
+        if counts["wp"] or counts["bp"] or counts["wR"] or counts["bR"] or counts["wQ"] or counts["bQ"]:
+            return False
+        knights = counts["wN"] + counts["bN"]
+        bishops = counts["wB"] + counts["bB"]
+        if knights + bishops <= 1:
+            return True
+        if knights:
+            return False
+        # Bishops that all stand on squares of one colour can never give mate
+        bishop_squares = self.bitboards["wB"] | self.bitboards["bB"]
+        return bishop_squares & DARK_SQUARES in (0, bishop_squares)
+
+    def generate_legal_captures(self):
+        return self.generate_legal_moves(captures_only=True)
+
+    def generate_legal_moves(self, captures_only=False):
+        # Checkers and pins are worked out once, so every move emitted here is already legal.
+        if self.white_turn:
+            color, enemy = 'w', 'b'
+            king_r, king_c = self.white_king_pos
         else:
-            self.checkmate = False
-            self.stalemate = False
+            color, enemy = 'b', 'w'
+            king_r, king_c = self.black_king_pos
+        king_sq = king_r * 8 + king_c
+        moves = []
 
-        self.enpassant_target = temp_enpassant
-        self.castle_rights = temp_rights
+        occupied_without_king = self.occupied & ~_square_bit(king_r, king_c)
+        targets = KING_ATTACKS[king_sq] & (self.occupancy[enemy] if captures_only else ~self.occupancy[color])
+        while targets:
+            lsb = targets & -targets
+            sq = lsb.bit_length() - 1
+            if not self.is_square_attacked(sq, enemy, occupied_without_king):
+                moves.append(Move((king_r, king_c), (sq >> 3, sq & 7), self.board))
+            targets ^= lsb
+
+        checkers = self.attackers_to(king_sq, enemy, self.occupied)
+        if checkers & (checkers - 1):
+            return moves
+        if checkers:
+            allowed = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+        elif captures_only:
+            allowed = ALL_SQUARES
+        else:
+            allowed = ALL_SQUARES
+            self.add_castling_moves(king_r, king_c, moves)
+        if captures_only:
+            # pawn pushes land on empty squares, so this mask leaves only captures (en passant is added separately)
+            allowed &= self.occupancy[enemy]
+
+        pin_rays = self._pin_rays(king_sq, color, enemy)
+        for piece_type, generator in self.move_generators.items():
+            if piece_type == 'K':
+                continue
+            pieces = self.bitboards[color + piece_type]
+            while pieces:
+                lsb = pieces & -pieces
+                sq = lsb.bit_length() - 1
+                if sq in pin_rays:
+                    generator(sq >> 3, sq & 7, moves, allowed & pin_rays[sq])
+                else:
+                    generator(sq >> 3, sq & 7, moves, allowed)
+                pieces ^= lsb
         return moves
 
+    def _pin_rays(self, king_sq, color, enemy):
+        # maps each pinned square to the ray it may still move along
+        pin_rays = {}
+        own = self.occupancy[color]
+        queens = self.bitboards[enemy + 'Q']
+        for rays, pinners in ((ROOK_RAYS, self.bitboards[enemy + 'R'] | queens),
+                              (BISHOP_RAYS, self.bitboards[enemy + 'B'] | queens)):
+            if not pinners:
+                continue
+            for table, positive in rays:
+                ray = table[king_sq]
+                if not ray & pinners:
+                    continue
+                blockers = ray & self.occupied
+                if positive:
+                    first = blockers & -blockers
+                    rest = blockers ^ first
+                    second = rest & -rest
+                else:
+                    first = 1 << (blockers.bit_length() - 1)
+                    rest = blockers ^ first
+                    second = 1 << (rest.bit_length() - 1) if rest else 0
+                if first & own and second & pinners:
+                    pin_rays[first.bit_length() - 1] = ray
+        return pin_rays
+
     def in_check(self):
         if self.white_turn:
             return self.square_threatened(self.white_king_pos[0], self.white_king_pos[1])
@@ -194,108 +643,119 @@ class ChessState:
             return self.square_threatened(self.black_king_pos[0], self.black_king_pos[1])
 
     def square_threatened(self, row, col):
-
-        original_turn = self.white_turn
-        self.white_turn = not original_turn
-        opponent_moves = self.get_all_moves()
-        self.white_turn = original_turn
-        for move in opponent_moves:
-            if move.end_row == row and move.end_col == col:
-                return True
+        return self.is_square_attacked(row * 8 + col, 'b' if self.white_turn else 'w')
+
+    def is_square_attacked(self, sq, by_color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        bitboards = self.bitboards
+        if KNIGHT_ATTACKS[sq] & bitboards[by_color + 'N']:
+            return True
+        # a pawn of by_color attacks sq from the squares an opposing pawn on sq would attack
+        if PAWN_ATTACKS['b' if by_color == 'w' else 'w'][sq] & bitboards[by_color + 'p']:
+            return True
+        if KING_ATTACKS[sq] & bitboards[by_color + 'K']:
+            return True
+        queens = bitboards[by_color + 'Q']
+        rooks = bitboards[by_color + 'R'] | queens
+        if rooks and slider_attacks(sq, occupied, ROOK_RAYS) & rooks:
+            return True
+        bishops = bitboards[by_color + 'B'] | queens
+        if bishops and slider_attacks(sq, occupied, BISHOP_RAYS) & bishops:
+            return True
         return False
 
+    def attackers_to(self, sq, by_color, occupied):
+        bitboards = self.bitboards
+        queens = bitboards[by_color + 'Q']
+        return ((KNIGHT_ATTACKS[sq] & bitboards[by_color + 'N'])
+                | (PAWN_ATTACKS['b' if by_color == 'w' else 'w'][sq] & bitboards[by_color + 'p'])
+                | (KING_ATTACKS[sq] & bitboards[by_color + 'K'])
+                | (slider_attacks(sq, occupied, ROOK_RAYS) & (bitboards[by_color + 'R'] | queens))
+                | (slider_attacks(sq, occupied, BISHOP_RAYS) & (bitboards[by_color + 'B'] | queens)))
+
     def get_all_moves(self):
         moves = []
-        for r in range(8):
-            for c in range(8):
-                if self.board[r][c] == "--":
-                    continue
-                color = self.board[r][c][0]
-                if (color == 'w' and self.white_turn) or (color == 'b' and not self.white_turn):
-                    piece_type = self.board[r][c][1]
-                    
-                    generator = self.move_generators.get(piece_type)
-                    if generator:
-                        generator(r, c, moves)
+        color = 'w' if self.white_turn else 'b'
+        for piece_type, generator in self.move_generators.items():
+            pieces = self.bitboards[color + piece_type]
+            while pieces:
+                lsb = pieces & -pieces
+                sq = lsb.bit_length() - 1
+                generator(sq >> 3, sq & 7, moves)
+                pieces ^= lsb
         return moves
 
-    def get_pawn_moves(self, r, c, moves):
-        if self.white_turn:
+    def _add_target_moves(self, r, c, targets, moves):
+        while targets:
+            lsb = targets & -targets
+            sq = lsb.bit_length() - 1
+            moves.append(Move((r, c), (sq >> 3, sq & 7), self.board))
+            targets ^= lsb
 
-            if r - 1 >= 0 and self.board[r-1][c] == "--":
-                moves.append(Move((r, c), (r-1, c), self.board))
-
-                if r == 6 and self.board[r-2][c] == "--":
-                    moves.append(Move((r, c), (r-2, c), self.board))
-
-            if c > 0:
-                if self.board[r-1][c-1][0] == 'b':
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
-                elif (r-1, c-1) == self.enpassant_target:
-                    moves.append(Move((r, c), (r-1, c-1), self.board, is_enpassant=True))
-            if c < 7:
-                if self.board[r-1][c+1][0] == 'b':
-                    moves.append(Move((r, c), (r-1, c+1), self.board))
-                elif (r-1, c+1) == self.enpassant_target:
-                    moves.append(Move((r, c), (r-1, c+1), self.board, is_enpassant=True))
+    def get_pawn_moves(self, r, c, moves, allowed=ALL_SQUARES):
+        if self.white_turn:
+            color, enemy, step, start_row = 'w', 'b', -1, 6
         else:
-            if r + 1 <= 7 and self.board[r+1][c] == "--":
-                moves.append(Move((r, c), (r+1, c), self.board))
-                if r == 1 and self.board[r+2][c] == "--":
-                    moves.append(Move((r, c), (r+2, c), self.board))
-            if c > 0:
-                if self.board[r+1][c-1][0] == 'w':
-                    moves.append(Move((r, c), (r+1, c-1), self.board))
-                elif (r+1, c-1) == self.enpassant_target:
-                    moves.append(Move((r, c), (r+1, c-1), self.board, is_enpassant=True))
-            if c < 7:
-                if self.board[r+1][c+1][0] == 'w':
-                    moves.append(Move((r, c), (r+1, c+1), self.board))
-                elif (r+1, c+1) == self.enpassant_target:
-                    moves.append(Move((r, c), (r+1, c+1), self.board, is_enpassant=True))
-
-    def get_rook_moves(self, r, c, moves):
-        self._slide_piece(r, c, moves, directions=[(1,0), (-1,0), (0,1), (0,-1)])
-
-    def get_bishop_moves(self, r, c, moves):
-        self._slide_piece(r, c, moves, directions=[(1,1), (-1,1), (1,-1), (-1,-1)])
-
-    def get_queen_moves(self, r, c, moves):
-        self._slide_piece(r, c, moves, directions=[(1,0), (-1,0), (0,1), (0,-1), (1,1), (-1,1), (1,-1), (-1,-1)])
-
-    def get_knight_moves(self, r, c, moves):
+            color, enemy, step, start_row = 'b', 'w', 1, 1
+
+        one_step = _square_bit(r + step, c)
+        if not self.occupied & one_step:
+            if one_step & allowed:
+                moves.append(Move((r, c), (r + step, c), self.board))
+            two_step = _square_bit(r + 2 * step, c) if r == start_row else 0
+            if two_step & allowed and not self.occupied & two_step:
+                moves.append(Move((r, c), (r + 2 * step, c), self.board))
+
+        attacks = PAWN_ATTACKS[color][r * 8 + c]
+        self._add_target_moves(r, c, attacks & self.occupancy[enemy] & allowed, moves)
+        if self.enpassant_target and attacks & _square_bit(*self.enpassant_target):
+            if self._enpassant_is_legal(r, c, enemy):
+                moves.append(Move((r, c), self.enpassant_target, self.board, is_enpassant=True))
+
+    def _set_enpassant_target(self, r, c):
+        # Kept (and hashed) only if a pawn can really take en passant, so a position has the same key
+        # whether it was reached by a double push or loaded from a FEN without the square
+        color, enemy = ('w', 'b') if self.white_turn else ('b', 'w')
+        self.enpassant_target = (r, c)
+        pawns = PAWN_ATTACKS[enemy][r * 8 + c] & self.bitboards[color + 'p']
+        while pawns:
+            sq = (pawns & -pawns).bit_length() - 1
+            if self._enpassant_is_legal(sq >> 3, sq & 7, enemy):
+                self.zobrist_key ^= ZOBRIST_ENPASSANT[c]
+                return
+            pawns &= pawns - 1
+        self.enpassant_target = ()
+
+    def _enpassant_is_legal(self, r, c, enemy):
+        # both pawns leave the capturing row at once, so pins and checks are re-tested on the resulting occupancy
+        end_r, end_c = self.enpassant_target
+        captured = _square_bit(r, end_c)
+        occupied = (self.occupied & ~_square_bit(r, c) & ~captured) | _square_bit(end_r, end_c)
+        king_r, king_c = self.white_king_pos if self.white_turn else self.black_king_pos
+        return not self.attackers_to(king_r * 8 + king_c, enemy, occupied) & ~captured
+
+    def get_rook_moves(self, r, c, moves, allowed=ALL_SQUARES):
+        self._slide_piece(r, c, moves, ROOK_RAYS, allowed)
+
+    def get_bishop_moves(self, r, c, moves, allowed=ALL_SQUARES):
+        self._slide_piece(r, c, moves, BISHOP_RAYS, allowed)
+
+    def get_queen_moves(self, r, c, moves, allowed=ALL_SQUARES):
+        self._slide_piece(r, c, moves, QUEEN_RAYS, allowed)
+
+    def get_knight_moves(self, r, c, moves, allowed=ALL_SQUARES):
         ally = 'w' if self.white_turn else 'b'
-        for dr, dc in [(-2,-1), (-1,-2), (-2,1), (-1,2), (2,1), (1,2), (2,-1), (1,-2)]:
-            end_r, end_c = r+dr, c+dc
-            if 0 <= end_r < 8 and 0 <= end_c < 8 and self.board[end_r][end_c][0] != ally:
-                moves.append(Move((r, c), (end_r, end_c), self.board))
+        self._add_target_moves(r, c, KNIGHT_ATTACKS[r * 8 + c] & ~self.occupancy[ally] & allowed, moves)
 
-    def get_king_moves(self, r, c, moves):
+    def get_king_moves(self, r, c, moves, allowed=ALL_SQUARES):
         ally = 'w' if self.white_turn else 'b'
-        for dr in [-1, 0, 1]:
-            for dc in [-1, 0, 1]:
-                if dr == dc == 0:
-                    continue
-                end_r, end_c = r + dr, c + dc
-                if 0 <= end_r < 8 and 0 <= end_c < 8 and self.board[end_r][end_c][0] != ally:
-                    moves.append(Move((r, c), (end_r, end_c), self.board))
+        self._add_target_moves(r, c, KING_ATTACKS[r * 8 + c] & ~self.occupancy[ally] & allowed, moves)
 
-    def _slide_piece(self, r, c, moves, directions):
+    def _slide_piece(self, r, c, moves, rays, allowed=ALL_SQUARES):
         ally = 'w' if self.white_turn else 'b'
-        for dr, dc in directions:
-            for step in range(1, 8):
-                end_r, end_c = r + dr * step, c + dc * step
-                if 0 <= end_r < 8 and 0 <= end_c < 8:
-                    target = self.board[end_r][end_c]
-                    if target == "--":
-                        moves.append(Move((r, c), (end_r, end_c), self.board))
-                    elif target[0] != ally:
-                        moves.append(Move((r, c), (end_r, end_c), self.board))
-                        break
-                    else:
-                        break
-                else:
-                    break
+        attacks = slider_attacks(r * 8 + c, self.occupied, rays)
+        self._add_target_moves(r, c, attacks & ~self.occupancy[ally] & allowed, moves)
 
     def add_castling_moves(self, r, c, moves):
         if self.square_threatened(r, c):
@@ -323,6 +783,15 @@ class CastleRights:
         self.wqs = wqs
         self.bqs = bqs
 
+    def mask(self):
+        return self.wks | self.wqs << 1 | self.bks << 2 | self.bqs << 3
+
+    def set_mask(self, mask):
+        self.wks = bool(mask & 1)
+        self.wqs = bool(mask & 2)
+        self.bks = bool(mask & 4)
+        self.bqs = bool(mask & 8)
+
 
 class Move:
     ranks_to_rows = {"1":7, "2":6, "3":5, "4":4, "5":3, "6":2, "7":1, "8":0}
@@ -330,25 +799,34 @@ class Move:
     files_to_cols = {"a":0, "b":1, "c":2, "d":3, "e":4, "f":5, "g":6, "h":7}
     cols_to_files = {v:k for k,v in files_to_cols.items()}
 
+    # Thousands of moves are built per search node, so no per-instance __dict__
+    __slots__ = ("start_row", "start_col", "end_row", "end_col", "piece_moved", "piece_taken",
+                 "pawn_promotion", "is_enpassant", "is_castling", "move_id")
+
     def __init__(self, start_sq, end_sq, board, is_enpassant=False, is_castling=False):
-        self.start_row, self.start_col = start_sq
-        self.end_row, self.end_col = end_sq
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_taken = board[self.end_row][self.end_col]
-        self.pawn_promotion = (
-            self.piece_moved == 'wp' and self.end_row == 0
-        ) or (
-            self.piece_moved == 'bp' and self.end_row == 7
-        )
+        start_row, start_col = start_sq
+        end_row, end_col = end_sq
+        self.start_row = start_row
+        self.start_col = start_col
+        self.end_row = end_row
+        self.end_col = end_col
+        piece_moved = self.piece_moved = board[start_row][start_col]
+        # pawns only move forward, so reaching either back rank means promotion
+        self.pawn_promotion = piece_moved[1] == 'p' and (end_row == 0 or end_row == 7)
         self.is_enpassant = is_enpassant
-        if self.is_enpassant:
-            self.piece_taken = 'wp' if self.piece_moved == 'bp' else 'bp'
+        if is_enpassant:
+            self.piece_taken = 'wp' if piece_moved == 'bp' else 'bp'
+        else:
+            self.piece_taken = board[end_row][end_col]
         self.is_castling = is_castling
-        self.move_id = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+        self.move_id = start_row * 1000 + start_col * 100 + end_row * 10 + end_col
 
     def __eq__(self, other):
         return isinstance(other, Move) and self.move_id == other.move_id
 
+    def __hash__(self):
+        return self.move_id
+
     def get_notation(self):
         return self._pos_to_notation(self.start_row, self.start_col) + self._pos_to_notation(self.end_row, self.end_col)
 
@@ -0,0 +1,154 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import AI
+import Engine
+from Book import parse_san
+
+DEFAULT_TIME = 1.0
+
+# opcode, then operands up to the closing semicolon; quoted operands may contain semicolons
+_OPERATION = re.compile(r'\s*([A-Za-z][A-Za-z0-9_]*)((?:\s*(?:"[^"]*"|[^;"\s]+))*)\s*;')
+_OPERAND = re.compile(r'"([^"]*)"|([^\s"]+)')
+
+
+def parse_epd(line):
+    # Returns (fen, {opcode: [operands]}); hmvc/fmvn fill in the FEN move counters when present
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f"EPD needs at least 4 fields: {line!r}")
+    operations = {}
+    rest = fields[4] if len(fields) > 4 else ""
+    position = 0
+    while position < len(rest) and rest[position:].strip():
+        match = _OPERATION.match(rest, position)
+        if match is None:
+            raise ValueError(f"Bad EPD operation at {rest[position:]!r}")
+        operations[match.group(1)] = [quoted or bare for quoted, bare in _OPERAND.findall(match.group(2))]
+        position = match.end()
+    halfmove = operations.get("hmvc", ["0"])[0]
+    fullmove = operations.get("fmvn", ["1"])[0]
+    return " ".join(fields[:4] + [halfmove, fullmove]), operations
+
+
+def format_epd(game_state, operations=None):
+    line = " ".join(game_state.get_fen().split()[:4])
+    for opcode, operands in (operations or {}).items():
+        rendered = [f'"{operand}"' if not operand or re.search(r'[\s;"]', operand) else operand
+                    for operand in operands]
+        line += " " + " ".join([opcode] + rendered) + ";"
+    return line
+
+
+def read_epd(path):
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                fen, operations = parse_epd(line)
+                yield line_number, fen, operations
+
+
+def solve_position(args):
+    line_number, fen, operations, time_limit, node_limit, max_depth = args
+    game_state = Engine.ChessState(fen)
+    legal_moves = game_state.generate_legal_moves()
+    best_moves = {move.move_id for move in (parse_san(san, legal_moves) for san in operations.get("bm", [])) if move}
+    avoid_moves = {move.move_id for move in (parse_san(san, legal_moves) for san in operations.get("am", [])) if move}
+
+    AI.transposition_table.clear()
+    stats = AI.SearchStats()
+    start = time.perf_counter()
+    move = AI.analyse_position(game_state, max_depth, time_limit, node_limit, stats)
+    seconds = time.perf_counter() - start
+
+    def correct(notation):
+        move_id = next((m.move_id for m in legal_moves if m.get_notation() == notation), None)
+        if best_moves and move_id not in best_moves:
+            return False
+        return move_id not in avoid_moves
+
+    # Time to solution: when the search settled on a correct move and kept it to the end
+    time_to_solution = None
+    for iteration in reversed(stats.iterations):
+        if not correct(iteration["best_move"]):
+            break
+        time_to_solution = iteration["seconds"]
+    solved = move is not None and (best_moves or avoid_moves) and correct(move.get_notation())
+    return {
+        "id": operations.get("id", [str(line_number)])[0],
+        "fen": fen,
+        "bm": operations.get("bm", []),
+        "am": operations.get("am", []),
+        "move": move.get_notation() if move else None,
+        "solved": bool(solved),
+        "time_to_solution": round(time_to_solution, 4) if solved else None,
+        "depth": stats.depth,
+        "nodes": stats.nodes,
+        "seconds": round(seconds, 4),
+        "stats": stats.summary(),
+    }
+
+
+def run_suite(paths, time_limit=DEFAULT_TIME, node_limit=None, max_depth=AI.MAX_PLY, processes=1):
+    jobs = ((line_number, fen, operations, time_limit, node_limit, max_depth)
+            for path in paths for line_number, fen, operations in read_epd(path))
+    results = []
+    if processes > 1:
+        # spawn to match the search pool; positions stream in and results come back in order
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            for result in pool.imap(solve_position, jobs):
+                results.append(result)
+                _print_result(result)
+    else:
+        for job in jobs:
+            result = solve_position(job)
+            results.append(result)
+            _print_result(result)
+    return results
+
+
+def _print_result(result):
+    expected = " ".join(result["bm"]) or "not " + " ".join(result["am"])
+    solved = f"ok {result['time_to_solution']:.2f}s" if result["solved"] else "--"
+    print(f"{result['id']:24} {expected:12} {result['move'] or '-':6} {solved:10} "
+          f"depth {result['depth']:>2}  nodes {result['nodes']:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an EPD test suite (bm/am records) through the search")
+    parser.add_argument("epd", nargs="+")
+    parser.add_argument("--time", type=float, default=DEFAULT_TIME, help="seconds per position")
+    parser.add_argument("--nodes", type=int, help="node budget per position instead of a time limit")
+    parser.add_argument("--depth", type=int, default=AI.MAX_PLY, help="deepest iteration")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", help="write per-position results to this file")
+    args = parser.parse_args(argv)
+
+    time_limit = None if args.nodes else args.time
+    start = time.perf_counter()
+    results = run_suite(args.epd, time_limit, args.nodes, args.depth, args.processes)
+    wall = time.perf_counter() - start
+
+    solved = [r for r in results if r["solved"]]
+    nodes = sum(r["nodes"] for r in results)
+    search_seconds = sum(r["seconds"] for r in results)
+    mean_time = sum(r["time_to_solution"] for r in solved) / len(solved) if solved else 0
+    print(f"solved {len(solved)}/{len(results)}"
+          f" ({len(solved) / len(results) * 100 if results else 0:.1f}%), mean time to solution {mean_time:.2f}s")
+    print(f"{nodes} nodes in {wall:.1f}s wall, {round(nodes / wall) if wall else 0} nps aggregate, "
+          f"{round(nodes / search_seconds) if search_seconds else 0} nps per process")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"solved": len(solved), "total": len(results), "nodes": nodes,
+                       "seconds": round(wall, 4), "results": results}, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from Rating import RATINGS_DB, RatingStore
+
+# Glicko-2 (Glickman, 2013). Ratings are held on the internal scale: mu = (r - 1500) / SCALE.
+SCALE = 173.7178
+DEFAULT_RATING = 1500.0
+DEFAULT_DEVIATION = 350.0
+DEFAULT_VOLATILITY = 0.06
+DEFAULT_TAU = 0.5
+DEFAULT_PERIOD_DAYS = 1.0
+CONVERGENCE = 1e-6
+MAX_ITERATIONS = 100
+
+
+def _g(phi):
+    return 1 / np.sqrt(1 + 3 * phi ** 2 / np.pi ** 2)
+
+
+def _new_volatility(phi, sigma, v, delta, tau):
+    # Illinois-variant regula falsi from step 5 of the paper, run for all players at once
+    a = np.log(sigma ** 2)
+    phi2 = phi ** 2
+
+    def f(x):
+        ex = np.exp(x)
+        return ex * (delta ** 2 - phi2 - v - ex) / (2 * (phi2 + v + ex) ** 2) - (x - a) / tau ** 2
+
+    big_a = a.copy()
+    big_b = np.where(delta ** 2 > phi2 + v, np.log(np.maximum(delta ** 2 - phi2 - v, 1e-300)), 0.0)
+    needs_search = delta ** 2 <= phi2 + v
+    k = np.ones_like(a)
+    while needs_search.any():
+        candidate = a - k * tau
+        found = f(candidate) >= 0
+        big_b = np.where(needs_search & found, candidate, big_b)
+        needs_search &= ~found
+        k += 1
+
+    f_a, f_b = f(big_a), f(big_b)
+    for _ in range(MAX_ITERATIONS):
+        active = np.abs(big_b - big_a) > CONVERGENCE
+        if not active.any():
+            break
+        big_c = big_a + (big_a - big_b) * f_a / (f_b - f_a)
+        f_c = f(big_c)
+        replace_a = f_c * f_b < 0
+        big_a = np.where(active & replace_a, big_b, big_a)
+        f_a = np.where(active & replace_a, f_b, np.where(active, f_a / 2, f_a))
+        big_b = np.where(active, big_c, big_b)
+        f_b = np.where(active, f_c, f_b)
+    return np.exp(big_a / 2)
+
+
+def rate_period(mu, phi, sigma, white, black, scores, tau=DEFAULT_TAU):
+    # One rating period: every game in it is scored against the ratings from the period's start
+    players = len(mu)
+    index = np.concatenate([white, black])
+    opponent = np.concatenate([black, white])
+    score = np.concatenate([scores, 1 - scores])
+
+    g = _g(phi[opponent])
+    expected = 1 / (1 + np.exp(-g * (mu[index] - mu[opponent])))
+    inverse_v = np.bincount(index, weights=g ** 2 * expected * (1 - expected), minlength=players)
+    improvement = np.bincount(index, weights=g * (score - expected), minlength=players)
+
+    played = inverse_v > 0
+    new_phi = np.sqrt(phi ** 2 + sigma ** 2)  # players who sat the period out only drift
+    new_mu, new_sigma = mu.copy(), sigma.copy()
+    if played.any():
+        v = 1 / inverse_v[played]
+        sigma_played = _new_volatility(phi[played], sigma[played], v, v * improvement[played], tau)
+        phi_star = np.sqrt(phi[played] ** 2 + sigma_played ** 2)
+        phi_played = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+        new_mu[played] = mu[played] + phi_played ** 2 * improvement[played]
+        new_phi[played] = phi_played
+        new_sigma[played] = sigma_played
+    return new_mu, new_phi, new_sigma
+
+
+def recompute(results, period_days=DEFAULT_PERIOD_DAYS, tau=DEFAULT_TAU):
+    # results: sequence of (timestamp, white_name, black_name, result for white)
+    if not len(results):
+        return {}
+    timestamps, white_names, black_names, scores = zip(*results)
+    names, players = np.unique(np.array(white_names + black_names), return_inverse=True)
+    white, black = players[:len(results)], players[len(results):]
+    scores = np.array(scores, dtype=float)
+    seconds = np.array(timestamps, dtype="datetime64[s]").astype(np.int64)
+    periods = (seconds - seconds.min()) // max(1, int(period_days * 86400))
+
+    order = np.argsort(periods, kind="stable")
+    periods, white, black, scores = periods[order], white[order], black[order], scores[order]
+    boundaries = np.flatnonzero(np.diff(periods)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(periods)]])
+
+    mu = np.zeros(len(names))
+    phi = np.full(len(names), DEFAULT_DEVIATION / SCALE)
+    sigma = np.full(len(names), DEFAULT_VOLATILITY)
+    previous_period = periods[0]
+    for start, end in zip(starts, ends):
+        # empty periods in between widen everyone's deviation
+        idle = periods[start] - previous_period - 1
+        if idle > 0:
+            phi = np.sqrt(phi ** 2 + idle * sigma ** 2)
+        previous_period = periods[start]
+        mu, phi, sigma = rate_period(mu, phi, sigma, white[start:end], black[start:end], scores[start:end], tau)
+
+    games = np.bincount(np.concatenate([white, black]), minlength=len(names))
+    return {
+        str(name): {
+            "rating": round(float(DEFAULT_RATING + SCALE * mu[i]), 1),
+            "deviation": round(float(SCALE * phi[i]), 1),
+            "volatility": round(float(sigma[i]), 6),
+            "games": int(games[i]),
+        }
+        for i, name in enumerate(names)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute Glicko-2 ratings from the whole stored game history")
+    parser.add_argument("--db", default=RATINGS_DB)
+    parser.add_argument("--period-days", type=float, default=DEFAULT_PERIOD_DAYS, help="length of a rating period")
+    parser.add_argument("--tau", type=float, default=DEFAULT_TAU, help="volatility constraint")
+    parser.add_argument("--json", help="write the ratings to this file")
+    args = parser.parse_args(argv)
+
+    store = RatingStore(args.db)
+    start = time.perf_counter()
+    results = store.results()
+    ratings = recompute(results, args.period_days, args.tau)
+    print(f"{len(results)} games, {len(ratings)} players in {time.perf_counter() - start:.2f}s\n")
+    for name, rating in sorted(ratings.items(), key=lambda item: -item[1]["rating"]):
+        print(f"{name:20} {rating['rating']:7.1f}  RD {rating['deviation']:5.1f}  "
+              f"volatility {rating['volatility']:.4f}  games {rating['games']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(ratings, f, indent=4)
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
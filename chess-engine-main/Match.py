@@ -0,0 +1,258 @@
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+import AI
+import Engine
+import Rating
+from Epd import parse_epd
+from Tablebase import probe as probe_tablebase
+
+# Balanced positions a few moves into common openings. Every opening is played twice with
+# colours reversed, so neither profile profits from a lopsided start.
+DEFAULT_OPENINGS = [
+    "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",  # Italian
+    "r1bqkbnr/1ppp1ppp/p1n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 4",  # Ruy Lopez
+    "rnbqkb1r/pp2pppp/3p1n2/8/3NP3/8/PPP2PPP/RNBQKB1R w KQkq - 1 5",  # Sicilian
+    "rnbqkb1r/ppp2ppp/4pn2/3p4/3PP3/2N5/PPP2PPP/R1BQKBNR w KQkq - 2 4",  # French
+    "rnbqkbnr/pp2pppp/2p5/8/3PN3/8/PPP2PPP/R1BQKBNR b KQkq - 0 4",  # Caro-Kann
+    "rnbqkb1r/ppp2ppp/4pn2/3p4/2PP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 2 4",  # Queen's Gambit Declined
+    "rnbqkb1r/pp2pppp/2p2n2/3p4/2PP4/5N2/PP2PPPP/RNBQKB1R w KQkq - 2 4",  # Slav
+    "rnbqk2r/ppp1ppbp/3p1np1/8/2PPP3/2N5/PP3PPP/R1BQKBNR w KQkq - 0 5",  # King's Indian
+    "rnbqkb1r/pppp1ppp/5n2/4p3/2P5/2N3P1/PP1PPP1P/R1BQKBNR b KQkq - 0 3",  # English
+    "rnb1kbnr/ppp1pppp/8/q7/8/2N5/PPPP1PPP/R1BQKBNR w KQkq - 2 4",  # Scandinavian
+]
+
+ADJUDICATION = {
+    "max_plies": 300,      # declared drawn after this many plies
+    "resign_margin": 10,   # material lead in pawns that counts as decisive...
+    "resign_plies": 8,     # ...once it has held for this many consecutive plies
+}
+PROFILE_KEYS = {"depth": int, "randomness": float, "time": float, "nodes": int, "book": int}
+
+
+class EngineProfile:
+    def __init__(self, name, rating, params=None, node_limit=None, use_book=True):
+        self.name = name
+        self.rating = rating
+        self.params = params or {}
+        self.node_limit = node_limit
+        self.use_book = use_book
+
+    @classmethod
+    def parse(cls, spec):
+        # name:rating[:key=value,...], e.g. "tier3:1500" or "new:1500:depth=4,nodes=20000,book=0"
+        parts = spec.split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Profile must look like name:rating[:key=value,...]: {spec!r}")
+        params, node_limit, use_book = {}, None, True
+        for option in filter(None, parts[2].split(",")) if len(parts) == 3 else []:
+            key, _, value = option.partition("=")
+            if key not in PROFILE_KEYS:
+                raise ValueError(f"Unknown profile option {key!r} (expected one of {', '.join(PROFILE_KEYS)})")
+            value = PROFILE_KEYS[key](value)
+            if key == "nodes":
+                node_limit = value
+            elif key == "book":
+                use_book = bool(value)
+            else:
+                params[key] = value
+        return cls(parts[0], float(parts[1]), params, node_limit, use_book)
+
+    def __repr__(self):
+        return f"EngineProfile({self.name!r}, {self.rating})"
+
+
+def read_openings(path):
+    # One FEN or EPD record per line
+    openings = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split()
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                openings.append(" ".join(fields[:6]))
+            else:
+                openings.append(parse_epd(line)[0])
+    return openings
+
+
+# Each profile keeps its own hash table inside a worker, so one engine never reads the other's entries
+_tables = {}
+
+
+def _table_for(profile):
+    if profile.name not in _tables:
+        _tables[profile.name] = AI.TranspositionTable(AI.DEFAULT_HASH_MB)
+    return _tables[profile.name]
+
+
+def play_game(args):
+    game_number, opening, white, black, adjudication = args
+    game_state = Engine.ChessState(opening)
+    decisive_plies = 0
+    plies = 0
+    while True:
+        moves = game_state.get_legal_moves()
+        if not moves:
+            if game_state.checkmate:
+                result, reason = (0.0 if game_state.white_turn else 1.0), "checkmate"
+            else:
+                result, reason = 0.5, game_state.draw_reason
+            break
+        if plies >= adjudication["max_plies"]:
+            result, reason = 0.5, "move limit"
+            break
+        known = probe_tablebase(game_state)
+        if known is not None:
+            outcome, _ = known
+            result = 0.5 if outcome == 0 else float((outcome > 0) == game_state.white_turn)
+            reason = "tablebase"
+            break
+        if abs(game_state.material_score) >= adjudication["resign_margin"]:
+            decisive_plies += 1
+            if decisive_plies >= adjudication["resign_plies"]:
+                result, reason = (1.0 if game_state.material_score > 0 else 0.0), "material adjudication"
+                break
+        else:
+            decisive_plies = 0
+
+        profile = white if game_state.white_turn else black
+        move = AI.pick_best_move(game_state, moves, profile.rating, table=_table_for(profile),
+                                 node_limit=profile.node_limit, processes=1,
+                                 book_path=AI.BOOK_FILE if profile.use_book else None, params=profile.params)
+        game_state.make_move(move)
+        plies += 1
+
+    return {
+        "game": game_number,
+        "white": white.name,
+        "black": black.name,
+        "opening": opening,
+        "result": result,
+        "reason": reason,
+        "plies": plies,
+        "final_fen": game_state.get_fen(),
+    }
+
+
+def schedule(profiles, games_per_pair, openings, adjudication):
+    # Round robin; consecutive games of a pair share an opening with colours reversed
+    game_number = 0
+    for first, second in itertools.combinations(profiles, 2):
+        for game in range(games_per_pair):
+            opening = openings[(game // 2) % len(openings)]
+            white, black = (first, second) if game % 2 == 0 else (second, first)
+            game_number += 1
+            yield game_number, opening, white, black, adjudication
+
+
+def elo_difference(wins, draws, losses):
+    # Returns (Elo difference, 95% margin) from the first player's point of view
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, float("inf")
+    score = (wins + draws / 2) / games
+    if score in (0, 1):
+        return math.copysign(float("inf"), score - 0.5), float("inf")
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+
+    def to_elo(fraction):
+        fraction = min(max(fraction, 1e-6), 1 - 1e-6)  # the margin can reach past 0 or 1
+        return -400 * math.log10(1 / fraction - 1)
+
+    return to_elo(score), (to_elo(score + margin) - to_elo(score - margin)) / 2
+
+
+def run_match(profiles, games_per_pair, openings, adjudication=None, processes=1, save_ratings=False):
+    adjudication = dict(ADJUDICATION, **(adjudication or {}))
+    players = {profile.name: Rating.PlayerRating(profile.rating) for profile in profiles}
+    jobs = schedule(profiles, games_per_pair, openings, adjudication)
+    results = []
+
+    def record(game):
+        results.append(game)
+        white, black = players[game["white"]], players[game["black"]]
+        white_before = white.rating
+        white.update(black.rating, game["result"])
+        black.update(white_before, 1 - game["result"])
+        if save_ratings:
+            Rating.save_ratings(white, black, game["white"], game["black"], game["result"])
+        score = {1.0: "1-0", 0.0: "0-1"}.get(game["result"], "1/2-1/2")
+        print(f"Game {game['game']:>4}: {game['white']} - {game['black']}  {score:7}  "
+              f"{game['reason']}, {game['plies']} plies")
+
+    if processes > 1:
+        # spawn to match the search pool; games finish in any order
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            for game in pool.imap_unordered(play_game, jobs):
+                record(game)
+    else:
+        for job in jobs:
+            record(play_game(job))
+    return results, players
+
+
+def summarize(profiles, results):
+    summary = []
+    for first, second in itertools.combinations(profiles, 2):
+        wins = draws = losses = 0
+        for game in results:
+            if {game["white"], game["black"]} != {first.name, second.name}:
+                continue
+            score = game["result"] if game["white"] == first.name else 1 - game["result"]
+            wins += score == 1
+            draws += score == 0.5
+            losses += score == 0
+        elo, margin = elo_difference(wins, draws, losses)
+        summary.append({"first": first.name, "second": second.name, "wins": wins, "draws": draws,
+                        "losses": losses, "elo": round(elo, 1), "margin": round(margin, 1)})
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine-vs-engine matches without the GUI")
+    parser.add_argument("profiles", nargs="+", help="name:rating[:depth=,randomness=,time=,nodes=,book=]")
+    parser.add_argument("--games", type=int, default=20, help="games per pairing")
+    parser.add_argument("--openings", help="file of FEN/EPD start positions (default: built-in list)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-plies", type=int, default=ADJUDICATION["max_plies"])
+    parser.add_argument("--resign-margin", type=float, default=ADJUDICATION["resign_margin"])
+    parser.add_argument("--resign-plies", type=int, default=ADJUDICATION["resign_plies"])
+    parser.add_argument("--save-ratings", action="store_true", help="record every game in the ratings file")
+    parser.add_argument("--json", help="write games and the summary to this file")
+    args = parser.parse_args(argv)
+
+    profiles = [EngineProfile.parse(spec) for spec in args.profiles]
+    if len(profiles) < 2 or len({profile.name for profile in profiles}) != len(profiles):
+        parser.error("need at least two profiles with distinct names")
+    openings = read_openings(args.openings) if args.openings else DEFAULT_OPENINGS
+    adjudication = {"max_plies": args.max_plies, "resign_margin": args.resign_margin,
+                    "resign_plies": args.resign_plies}
+
+    start = time.perf_counter()
+    results, players = run_match(profiles, args.games, openings, adjudication, args.processes, args.save_ratings)
+    print(f"\n{len(results)} games in {time.perf_counter() - start:.1f}s")
+    summary = summarize(profiles, results)
+    for pair in summary:
+        print(f"{pair['first']} vs {pair['second']}: +{pair['wins']} ={pair['draws']} -{pair['losses']}  "
+              f"Elo {pair['elo']:+.1f} +/- {pair['margin']:.1f}")
+    for name, player in players.items():
+        print(f"{name}: rating {player.get_rating()}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "games": sorted(results, key=lambda game: game["game"])}, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
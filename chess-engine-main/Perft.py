@@ -0,0 +1,172 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+import Engine
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Published node counts. The engine only promotes to a queen, so every position and depth
+# listed here was chosen because its reference tree contains no promotions at all.
+PERFT_SUITE = [
+    ("start", STARTING_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862}),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6}),
+    ("short-castle-check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     {6: 661072}),
+    ("long-castle-check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+     {6: 803711}),
+    ("castle-rights-rook-capture", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     {4: 1274206}),
+    ("castle-prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     {4: 1720476}),
+    ("stalemate-checkmate", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     {4: 23527}),
+]
+
+
+class PerftCounter:
+    def __init__(self):
+        # undo_move must hand back the exact position it was given; the Zobrist key covers
+        # pieces, side to move, castle rights and en passant, so any drift shows up here.
+        self.restore_errors = 0
+
+    def perft(self, game_state, depth):
+        moves = game_state.generate_legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            key = game_state.zobrist_key
+            game_state.make_move(move)
+            nodes += self.perft(game_state, depth - 1)
+            game_state.undo_move()
+            if game_state.zobrist_key != key:
+                self.restore_errors += 1
+                game_state.zobrist_key = key
+        return nodes
+
+    def divide(self, game_state, depth):
+        counts = {}
+        for move in game_state.generate_legal_moves():
+            key = game_state.zobrist_key
+            game_state.make_move(move)
+            counts[move.get_notation()] = self.perft(game_state, depth - 1) if depth > 1 else 1
+            game_state.undo_move()
+            if game_state.zobrist_key != key:
+                self.restore_errors += 1
+                game_state.zobrist_key = key
+        return counts
+
+
+def run_perft(fen, depth):
+    counter = PerftCounter()
+    game_state = Engine.ChessState(fen)
+    start = time.perf_counter()
+    nodes = counter.perft(game_state, depth)
+    seconds = time.perf_counter() - start
+    return {
+        "fen": fen,
+        "depth": depth,
+        "nodes": nodes,
+        "seconds": round(seconds, 4),
+        "nps": round(nodes / seconds) if seconds > 0 else None,
+        "restore_errors": counter.restore_errors,
+    }
+
+
+def run_suite(max_depth, names=None):
+    results = []
+    for name, fen, reference in PERFT_SUITE:
+        if names and name not in names:
+            continue
+        for depth in sorted(reference):
+            if depth > max_depth:
+                continue
+            result = run_perft(fen, depth)
+            result["name"] = name
+            result["expected"] = reference[depth]
+            result["ok"] = result["nodes"] == reference[depth] and result["restore_errors"] == 0
+            results.append(result)
+            print(f"{name:28} depth {depth}  nodes {result['nodes']:>9}  expected {reference[depth]:>9}  "
+                  f"{result['nps'] or 0:>8} nps  {'ok' if result['ok'] else 'FAIL'}"
+                  + (f"  ({result['restore_errors']} undo restore errors)" if result["restore_errors"] else ""))
+    return results
+
+
+def compare_results(results, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = {(r["name"], r["depth"]): r for r in json.load(f)["results"]}
+    for result in results:
+        previous = baseline.get((result["name"], result["depth"]))
+        if previous is None or not previous.get("nps") or not result["nps"]:
+            continue
+        change = (result["nps"] - previous["nps"]) / previous["nps"] * 100
+        print(f"{result['name']:28} depth {result['depth']}  nps {previous['nps']:>8} -> {result['nps']:>8}  ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts and throughput for Engine move generation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    suite = commands.add_parser("suite", help="run the reference positions and check node counts")
+    suite.add_argument("--depth", type=int, default=4, help="deepest reference depth to run")
+    suite.add_argument("--position", action="append", help="only run the named position (repeatable)")
+    suite.add_argument("--json", help="write machine-readable results to this file")
+    suite.add_argument("--compare", help="report nps changes against an earlier --json file")
+
+    perft = commands.add_parser("perft", help="count leaf nodes of one position")
+    perft.add_argument("depth", type=int)
+    perft.add_argument("--fen", default=STARTING_FEN)
+
+    divide = commands.add_parser("divide", help="node counts per root move")
+    divide.add_argument("depth", type=int)
+    divide.add_argument("--fen", default=STARTING_FEN)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "suite":
+        results = run_suite(args.depth, args.position)
+        total_nodes = sum(r["nodes"] for r in results)
+        total_seconds = sum(r["seconds"] for r in results)
+        failed = [r for r in results if not r["ok"]]
+        print(f"{len(results) - len(failed)}/{len(results)} passed, {total_nodes} nodes, "
+              f"{round(total_nodes / total_seconds) if total_seconds else 0} nps")
+        if args.compare:
+            compare_results(results, args.compare)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "python": platform.python_version(),
+                    "results": results,
+                }, f, indent=4)
+        return 1 if failed else 0
+
+    if args.command == "perft":
+        result = run_perft(args.fen, args.depth)
+        print(f"nodes {result['nodes']}  {result['seconds']}s  {result['nps']} nps")
+        if result["restore_errors"]:
+            print(f"{result['restore_errors']} undo restore errors")
+        return 1 if result["restore_errors"] else 0
+
+    counter = PerftCounter()
+    counts = counter.divide(Engine.ChessState(args.fen), args.depth)
+    for notation in sorted(counts):
+        print(f"{notation}: {counts[notation]}")
+    print(f"\nmoves {len(counts)}  nodes {sum(counts.values())}")
+    if counter.restore_errors:
+        print(f"{counter.restore_errors} undo restore errors")
+    return 1 if counter.restore_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
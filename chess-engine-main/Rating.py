@@ -1,68 +1,166 @@
-import json
-import os
-from datetime import datetime
-
-RATINGS_FILE = "ratings.json"
-
-class PlayerRating:
-    def __init__(self, rating: float = 1200.0):
-        self.rating = rating
-
-    def get_rating(self) -> int:
-        return round(self.rating)
-
-    def update(self, opponent_rating: float, result: float):
-        K = 64
-        expected_score = 1 / (1 + 10 ** ((opponent_rating - self.rating) / 400))
-        self.rating += K * (result - expected_score)
-
-    def __repr__(self):
-        return f"PlayerRating({self.get_rating()})"
-
-
-def save_ratings(white_player: PlayerRating, black_player: PlayerRating, white_name="White", black_name="Black"):
-    """Save current ratings to ratings.json with timestamp and game index"""
-    game_data = {
-        "game": None,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "white_name": white_name,
-        "black_name": black_name,
-        "white": white_player.get_rating(),
-        "black": black_player.get_rating()
-    }
-
-    if os.path.exists(RATINGS_FILE):
-        try:
-            with open(RATINGS_FILE, "r") as f:
-                data = json.load(f)
-        except json.JSONDecodeError:
-            data = []
-    else:
-        data = []
-
-    game_data["game"] = f"Game{len(data) + 1}"
-
-    data.append(game_data)
-    with open(RATINGS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-
-def load_ratings():
-    if os.path.exists(RATINGS_FILE):
-        try:
-            with open(RATINGS_FILE, "r") as f:
-                data = json.load(f)
-            if isinstance(data, list) and len(data) > 0:
-                last = data[-1]
-                white_rating = last.get("white", 1200)
-                black_rating = last.get("black", 1200)
-                return {
-                    "white": PlayerRating(white_rating),
-                    "black": PlayerRating(black_rating)
-                }
-        except (json.JSONDecodeError, KeyError):
-            pass
-    return {
-        "white": PlayerRating(),
-        "black": PlayerRating()
-    }
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+RATINGS_DB = "ratings.db"
+RATINGS_FILE = "ratings.json"  # pre-database history, imported into RATINGS_DB once
+
+class PlayerRating:
+    def __init__(self, rating: float = 1200.0):
+        self.rating = rating
+
+    def get_rating(self) -> int:
+        return round(self.rating)
+
+    def update(self, opponent_rating: float, result: float):
+        K = 64
+        expected_score = 1 / (1 + 10 ** ((opponent_rating - self.rating) / 400))
+        self.rating += K * (result - expected_score)
+
+    def __repr__(self):
+        return f"PlayerRating({self.get_rating()})"
+
+
+class RatingStore:
+    """Append-only game history in SQLite (WAL mode), safe for several writer processes."""
+
+    def __init__(self, path: str = RATINGS_DB, legacy_path: str = RATINGS_FILE):
+        self.path = path
+        # autocommit; writes open their own BEGIN IMMEDIATE so concurrent writers queue on the lock
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self._write():
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS games ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL,"
+                " white_name TEXT NOT NULL, black_name TEXT NOT NULL,"
+                " white INTEGER NOT NULL, black INTEGER NOT NULL, result REAL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS games_white ON games (white_name, id)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS games_black ON games (black_name, id)")
+            # latest rating per player, updated in the same transaction as the game row
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS players ("
+                " name TEXT PRIMARY KEY, rating INTEGER NOT NULL, last_game INTEGER NOT NULL)"
+            )
+            empty = self.connection.execute("SELECT 1 FROM games LIMIT 1").fetchone() is None
+            if empty and legacy_path and os.path.exists(legacy_path):
+                self._import_legacy(legacy_path)
+
+    def _write(self):
+        return _Transaction(self.connection)
+
+    def _import_legacy(self, legacy_path: str):
+        try:
+            with open(legacy_path, "r") as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            return
+        for record in data if isinstance(data, list) else []:
+            self._insert(record.get("timestamp", ""), record.get("white_name", "White"),
+                         record.get("black_name", "Black"), record.get("white", 1200),
+                         record.get("black", 1200), record.get("result"))
+
+    def _insert(self, timestamp, white_name, black_name, white, black, result):
+        game_id = self.connection.execute(
+            "INSERT INTO games (timestamp, white_name, black_name, white, black, result)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (timestamp, white_name, black_name, white, black, result),
+        ).lastrowid
+        self.connection.executemany(
+            "INSERT INTO players (name, rating, last_game) VALUES (?, ?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET rating = excluded.rating, last_game = excluded.last_game",
+            [(white_name, white, game_id), (black_name, black, game_id)],
+        )
+        return game_id
+
+    def record_game(self, white_name: str, black_name: str, white: int, black: int, result: float = None) -> int:
+        with self._write():
+            return self._insert(datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                white_name, black_name, white, black, result)
+
+    def latest_game(self):
+        row = self.connection.execute("SELECT * FROM games ORDER BY id DESC LIMIT 1").fetchone()
+        return _game_record(row) if row else None
+
+    def latest_rating(self, name: str):
+        row = self.connection.execute("SELECT rating FROM players WHERE name = ?", (name,)).fetchone()
+        return row["rating"] if row else None
+
+    def player_games(self, name: str, limit: int = None):
+        # Most recent first
+        rows = self.connection.execute(
+            "SELECT * FROM games WHERE white_name = ? OR black_name = ? ORDER BY id DESC LIMIT ?",
+            (name, name, -1 if limit is None else limit),
+        )
+        return [_game_record(row) for row in rows]
+
+    def games(self):
+        # Whole history in the order it was played
+        for row in self.connection.execute("SELECT * FROM games ORDER BY id"):
+            yield _game_record(row)
+
+    def results(self):
+        # (timestamp, white_name, black_name, result) for every game with a known result, in order
+        rows = self.connection.execute(
+            "SELECT timestamp, white_name, black_name, result FROM games WHERE result IS NOT NULL ORDER BY id"
+        )
+        return [tuple(row) for row in rows]
+
+    def close(self):
+        self.connection.close()
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+def _game_record(row):
+    record = dict(row)
+    record["game"] = f"Game{record.pop('id')}"
+    return record
+
+
+_store = None
+
+
+def get_store() -> RatingStore:
+    # One connection per process; SQLite connections must not cross a fork or spawn
+    global _store
+    if _store is None:
+        _store = RatingStore()
+    return _store
+
+
+def save_ratings(white_player: PlayerRating, black_player: PlayerRating, white_name="White", black_name="Black",
+                 result: float = None):
+    """Append the game's ratings (and result from White's side, if known) to the rating store"""
+    get_store().record_game(white_name, black_name, white_player.get_rating(), black_player.get_rating(), result)
+
+
+def load_ratings():
+    last = None
+    if os.path.exists(RATINGS_DB) or os.path.exists(RATINGS_FILE):
+        try:
+            last = get_store().latest_game()
+        except sqlite3.Error:
+            pass
+    if last is not None:
+        return {
+            "white": PlayerRating(last["white"]),
+            "black": PlayerRating(last["black"])
+        }
+    return {
+        "white": PlayerRating(),
+        "black": PlayerRating()
+    }
@@ -0,0 +1,275 @@
+import argparse
+import os
+import sys
+import time
+
+import Engine
+from Engine import KING_ATTACKS, PAWN_ATTACKS, QUEEN_RAYS, ROOK_RAYS, slider_attacks
+
+TABLEBASE_DIR = "tablebases"
+
+# King + one piece against a bare king. The strong side is stored as white; black-strong
+# positions are flipped vertically before probing. KPK depends on KQK for its promotions.
+ENDINGS = {"KQK": "Q", "KRK": "R", "KPK": "p"}
+ENDING_OF = {piece_type: name for name, piece_type in ENDINGS.items()}
+DRAWN_PIECES = {"B", "N"}  # a lone minor piece can never force mate
+
+# Each table holds one byte per (side to move, strong king, strong piece, weak king):
+# 0 for draws and illegal positions, otherwise the distance to mate in plies + 1.
+STRONG_TO_MOVE, WEAK_TO_MOVE = 0, 1
+
+
+def _pawnless_transform(king_sq):
+    # Reflect the board so the strong king lands in the a1-d1-d4 triangle
+    row, col = divmod(king_sq, 8)
+    flip_col, flip_row = col > 3, row < 4
+    row, col = (7 - row if flip_row else row), (7 - col if flip_col else col)
+    transpose = 7 - row > col
+    mapping = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        r, c = (7 - r if flip_row else r), (7 - c if flip_col else c)
+        if transpose:
+            r, c = 7 - c, 7 - r
+        mapping.append(r * 8 + c)
+    return mapping
+
+
+def _pawn_transform(king_sq):
+    # Pawns fix the board's orientation, leaving only the left-right mirror
+    if king_sq % 8 > 3:
+        return [sq ^ 7 for sq in range(64)]
+    return list(range(64))
+
+
+class TableLayout:
+    def __init__(self, piece_type):
+        self.piece_type = piece_type
+        make_transform = _pawn_transform if piece_type == "p" else _pawnless_transform
+        self.transforms = [make_transform(sq) for sq in range(64)]
+        self.king_squares = sorted({self.transforms[sq][sq] for sq in range(64)})
+        self.king_index = {sq: i for i, sq in enumerate(self.king_squares)}
+        self.size = 2 * len(self.king_squares) * 64 * 64
+
+    def index(self, side, strong_king, piece, weak_king):
+        transform = self.transforms[strong_king]
+        king = self.king_index[transform[strong_king]]
+        return ((side * len(self.king_squares) + king) * 64 + transform[piece]) * 64 + transform[weak_king]
+
+    def decode(self, index):
+        weak_king, piece = index & 63, (index >> 6) & 63
+        side, king = divmod(index >> 12, len(self.king_squares))
+        return side, self.king_squares[king], piece, weak_king
+
+
+def _piece_attacks(piece_type, piece, occupied):
+    if piece_type == "Q":
+        return slider_attacks(piece, occupied, QUEEN_RAYS)
+    if piece_type == "R":
+        return slider_attacks(piece, occupied, ROOK_RAYS)
+    return PAWN_ATTACKS["w"][piece]
+
+
+def _is_legal(layout, side, strong_king, piece, weak_king):
+    if len({strong_king, piece, weak_king}) < 3 or KING_ATTACKS[strong_king] >> weak_king & 1:
+        return False
+    if layout.piece_type == "p" and not 1 <= piece // 8 <= 6:
+        return False
+    if side == STRONG_TO_MOVE:
+        # the weak king cannot have been left in check
+        occupied = 1 << strong_king | 1 << piece | 1 << weak_king
+        return not _piece_attacks(layout.piece_type, piece, occupied) >> weak_king & 1
+    return True
+
+
+def _strong_moves(layout, strong_king, piece, weak_king):
+    # Yields (strong king, piece, promoted) after each strong move
+    occupied = 1 << strong_king | 1 << piece | 1 << weak_king
+    targets = KING_ATTACKS[strong_king] & ~KING_ATTACKS[weak_king] & ~(1 << piece)
+    while targets:
+        target = (targets & -targets).bit_length() - 1
+        targets &= targets - 1
+        yield target, piece, False
+    if layout.piece_type == "p":
+        ahead = piece - 8
+        if not occupied >> ahead & 1:
+            yield strong_king, ahead, ahead < 8
+            if piece // 8 == 6 and not occupied >> (ahead - 8) & 1:
+                yield strong_king, ahead - 8, False
+        return
+    targets = _piece_attacks(layout.piece_type, piece, occupied) & ~(1 << strong_king)
+    while targets:
+        target = (targets & -targets).bit_length() - 1
+        targets &= targets - 1
+        yield strong_king, target, False
+
+
+def _weak_moves(layout, strong_king, piece, weak_king):
+    # Returns (in check, weak king targets); a target equal to piece is a capture
+    occupied_without_king = 1 << strong_king | 1 << piece
+    attacked = KING_ATTACKS[strong_king] | _piece_attacks(layout.piece_type, piece, occupied_without_king)
+    in_check = bool(attacked >> weak_king & 1)
+    targets = KING_ATTACKS[weak_king] & ~attacked & ~(1 << strong_king)
+    return in_check, targets
+
+
+def generate_table(piece_type, queen_table=None):
+    # Retrograde analysis: start from every mate and walk predecessor links outwards one ply
+    # at a time. A strong-to-move position is won as soon as one move reaches a lost position;
+    # a weak-to-move position is lost once every one of its moves has been shown to lose.
+    layout = TableLayout(piece_type)
+    queen_layout = TableLayout("Q") if queen_table is not None else None
+    predecessors = {}
+    unresolved = {}
+    best = {}
+    buckets = [[] for _ in range(256)]
+
+    for index in range(layout.size):
+        side, strong_king, piece, weak_king = layout.decode(index)
+        if not _is_legal(layout, side, strong_king, piece, weak_king):
+            continue
+        if side == STRONG_TO_MOVE:
+            for king_to, piece_to, promoted in _strong_moves(layout, strong_king, piece, weak_king):
+                if promoted:
+                    value = queen_table[queen_layout.index(WEAK_TO_MOVE, king_to, piece_to, weak_king)]
+                    if value and value < best.get(index, 256):
+                        best[index] = value
+                        buckets[value].append(index)
+                    continue
+                child = layout.index(WEAK_TO_MOVE, king_to, piece_to, weak_king)
+                predecessors.setdefault(child, []).append(index)
+        else:
+            in_check, targets = _weak_moves(layout, strong_king, piece, weak_king)
+            unresolved[index] = targets.bit_count()
+            if not targets and in_check:
+                best[index] = 0
+                buckets[0].append(index)
+            while targets:
+                target = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                if target != piece:  # taking the piece is a dead draw and never resolves
+                    child = layout.index(STRONG_TO_MOVE, strong_king, piece, target)
+                    predecessors.setdefault(child, []).append(index)
+
+    table = bytearray(layout.size)
+    for distance in range(255):
+        for index in buckets[distance]:
+            if table[index] or best[index] != distance:
+                continue
+            table[index] = distance + 1
+            for parent in predecessors.get(index, ()):
+                if table[parent]:
+                    continue
+                if parent >> 12 < len(layout.king_squares):  # strong to move
+                    if distance + 1 < best.get(parent, 256):
+                        best[parent] = distance + 1
+                        buckets[distance + 1].append(parent)
+                else:
+                    unresolved[parent] -= 1
+                    if unresolved[parent] == 0:
+                        best[parent] = distance + 1
+                        buckets[distance + 1].append(parent)
+    return table
+
+
+def table_path(name, directory=TABLEBASE_DIR):
+    return os.path.join(directory, name + ".tb")
+
+
+def generate_all(directory=TABLEBASE_DIR, names=None):
+    os.makedirs(directory, exist_ok=True)
+    tables = {}
+    for name, piece_type in ENDINGS.items():
+        if names and name not in names and not (name == "KQK" and "KPK" in names):
+            continue
+        start = time.perf_counter()
+        tables[name] = generate_table(piece_type, tables.get("KQK") if piece_type == "p" else None)
+        with open(table_path(name, directory), "wb") as f:
+            f.write(tables[name])
+        longest = max(tables[name]) - 1
+        print(f"{name}: {len(tables[name])} bytes, longest mate {longest} plies, "
+              f"{time.perf_counter() - start:.1f}s")
+    return tables
+
+
+_tables = {}
+_layouts = {piece_type: TableLayout(piece_type) for piece_type in ENDINGS.values()}
+
+
+def load_table(name, directory=TABLEBASE_DIR):
+    # Tables are read on first use and cached; a missing file disables that ending
+    key = (directory, name)
+    if key not in _tables:
+        path = table_path(name, directory)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                _tables[key] = f.read()
+        else:
+            _tables[key] = None
+    return _tables[key]
+
+
+def probe(game_state, directory=TABLEBASE_DIR):
+    # Returns (result, plies to mate) for the side to move, result being 1 win, 0 draw, -1 loss,
+    # or None when the position is not covered by a table on disk.
+    if game_state.occupied.bit_count() != 3 or game_state.castle_rights.mask():
+        return None
+    bitboards = game_state.bitboards
+    for color in "wb":
+        for piece_type in ("Q", "R", "p", "B", "N"):
+            piece_bits = bitboards[color + piece_type]
+            if piece_bits:
+                break
+        else:
+            continue
+        break
+    else:
+        return None
+    if piece_type in DRAWN_PIECES:
+        return 0, 0
+
+    table = load_table(ENDING_OF[piece_type], directory)
+    if table is None:
+        return None
+    weak = "b" if color == "w" else "w"
+    strong_king = bitboards[color + "K"].bit_length() - 1
+    weak_king = bitboards[weak + "K"].bit_length() - 1
+    piece = piece_bits.bit_length() - 1
+    if color == "b":
+        strong_king, piece, weak_king = strong_king ^ 56, piece ^ 56, weak_king ^ 56
+    side = STRONG_TO_MOVE if game_state.white_turn == (color == "w") else WEAK_TO_MOVE
+    value = table[_layouts[piece_type].index(side, strong_king, piece, weak_king)]
+    if not value:
+        return 0, 0
+    return (1 if side == STRONG_TO_MOVE else -1), value - 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="build the distance-to-mate tables")
+    generate.add_argument("--ending", action="append", choices=sorted(ENDINGS),
+                          help="only build this ending (repeatable)")
+    generate.add_argument("--dir", default=TABLEBASE_DIR)
+
+    probe_command = commands.add_parser("probe", help="look up a position")
+    probe_command.add_argument("fen")
+    probe_command.add_argument("--dir", default=TABLEBASE_DIR)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        generate_all(args.dir, args.ending)
+        return 0
+
+    result = probe(Engine.ChessState(args.fen), args.dir)
+    if result is None:
+        print("not in tablebases")
+        return 1
+    outcome, plies = result
+    print({1: f"win, mate in {plies} plies", 0: "draw", -1: f"loss, mated in {plies} plies"}[outcome])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import sys
+import threading
+
+import AI
+import Engine
+
+ENGINE_NAME = "chess-engine"
+UCI_RATING = 2000  # full strength: deepest tier, no random moves or evaluation noise
+DEFAULT_MOVES_TO_GO = 30
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+
+
+class UciEngine:
+    # Commands are read on the main thread while searches run on a worker thread, so "stop"
+    # and "isready" are answered immediately even in the middle of a search.
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.game_state = Engine.ChessState()
+        self.processes = AI.DEFAULT_PROCESSES
+        self.search_thread = None
+        self.stop_event = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        # Returns False once the GUI asks us to quit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send("id author chess-engine contributors")
+            self.send(f"option name Hash type spin default {AI.DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+            self.send(f"option name Threads type spin default {AI.DEFAULT_PROCESSES} min 1 max {MAX_THREADS}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.stop()
+            AI.transposition_table.clear()
+            self.game_state = Engine.ChessState()
+        elif command == "position":
+            self.stop()
+            self.set_position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        return True
+
+    def set_option(self, args):
+        # setoption name <name> value <value>
+        if "name" not in args:
+            return
+        value_at = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:value_at]).lower()
+        value = " ".join(args[value_at + 1:])
+        try:
+            if name == "hash":
+                self.stop()
+                AI.set_hash_size(min(max(int(value), 1), MAX_HASH_MB))
+            elif name == "threads":
+                self.processes = min(max(int(value), 1), MAX_THREADS)
+        except ValueError:
+            self.send(f"info string bad value {value!r} for option {name}")
+
+    def set_position(self, args):
+        if not args:
+            return
+        if args[0] == "startpos":
+            fen, rest = None, args[1:]
+        elif args[0] == "fen":
+            fen_end = args.index("moves") if "moves" in args else len(args)
+            fen, rest = " ".join(args[1:fen_end]), args[fen_end:]
+        else:
+            return
+        try:
+            game_state = Engine.ChessState(fen)
+        except ValueError as error:
+            self.send(f"info string {error}")
+            return
+        for notation in rest[1:] if rest and rest[0] == "moves" else []:
+            move = find_move(game_state, notation)
+            if move is None:
+                self.send(f"info string illegal move {notation}")
+                break
+            game_state.make_move(move)
+        self.game_state = game_state
+
+    def go(self, args):
+        options = {}
+        for token, value in zip(args, args[1:]):
+            if token in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes") \
+                    and value.isdigit():
+                options[token] = int(value)
+        time_limit = self.time_for_move(options)
+
+        # GUIs adjudicate draws themselves, so a move is given even if a drawing rule applies
+        valid_moves = self.game_state.generate_legal_moves()
+        if not valid_moves:
+            self.send("bestmove 0000")
+            return
+        params = {"randomness": 0}
+        if time_limit is not None or "depth" in options or "nodes" in options or "infinite" in args:
+            # explicit limits replace the tier's depth and thinking time; a bare "go" keeps them
+            params.update(depth=options.get("depth", AI.MAX_PLY), time=None)
+        self.stop_event = threading.Event()
+        self.search_thread = threading.Thread(
+            target=self._search,
+            args=(self.game_state, valid_moves, params, time_limit, options.get("nodes"), self.stop_event,
+                  "infinite" in args),
+            daemon=True,
+        )
+        self.search_thread.start()
+
+    def time_for_move(self, options):
+        if "movetime" in options:
+            return options["movetime"] / 1000
+        remaining = options.get("wtime" if self.game_state.white_turn else "btime")
+        if remaining is None:
+            return None
+        increment = options.get("winc" if self.game_state.white_turn else "binc", 0)
+        budget = remaining / options.get("movestogo", DEFAULT_MOVES_TO_GO) + increment * 0.8
+        return max(0.01, min(budget, remaining * 0.5) / 1000)
+
+    def _search(self, game_state, valid_moves, params, time_limit, node_limit, stop_event, infinite=False):
+        side = 1 if game_state.white_turn else -1
+
+        def report(iteration):
+            # sent as each depth completes, so "go infinite" shows progress before "stop"
+            self.send(f"info depth {iteration['depth']} score {uci_score(iteration['score'] * side)} "
+                      f"nodes {iteration['nodes']} time {round(iteration['seconds'] * 1000)} "
+                      f"nps {iteration['nps']} pv {' '.join(iteration['pv'])}")
+
+        stats = AI.SearchStats(on_iteration=report)
+        move = AI.pick_best_move(game_state, valid_moves, UCI_RATING, time_limit=time_limit, node_limit=node_limit,
+                                 stop_event=stop_event, processes=self.processes, stats=stats, params=params)
+        if infinite:
+            # book and tablebase moves, or a search that ran out of depth, must still wait for "stop"
+            stop_event.wait()
+        self.send(f"bestmove {uci_notation(move) if move else '0000'}")
+
+    def stop(self):
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def uci_notation(move):
+    return move.get_notation() + ("q" if move.pawn_promotion else "")
+
+
+def uci_score(score):
+    # score is in pawns from the side to move's point of view; mates are given in moves
+    if abs(score) >= AI.CHECKMATE - AI.MAX_PLY:
+        plies = AI.CHECKMATE - abs(score)
+    elif abs(score) >= AI.MATE_BOUND:
+        plies = AI.TABLEBASE_WIN - abs(score)  # tablebase wins count the plies to mate the same way
+    else:
+        return f"cp {round(score * 100)}"
+    moves = (round(plies) + 1) // 2
+    return f"mate {moves if score > 0 else -moves}"
+
+
+def find_move(game_state, notation):
+    # The engine only promotes to a queen, so any promotion suffix selects the queen move
+    for move in game_state.generate_legal_moves():
+        if move.get_notation() == notation[:4]:
+            return move
+    return None
+
+
+def main():
+    engine = UciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
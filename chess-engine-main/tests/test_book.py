@@ -0,0 +1,49 @@
+import unittest
+
+import Engine
+from Book import parse_san
+
+
+def notation(fen, san):
+    move = parse_san(san, Engine.ChessState(fen).generate_legal_moves())
+    return move.get_notation() if move else None
+
+
+class ParseSanTest(unittest.TestCase):
+    def test_disambiguation(self):
+        knights = "4k3/8/8/8/8/5N2/8/1N2K3 w - - 0 1"
+        self.assertEqual(notation(knights, "Nbd2"), "b1d2")
+        self.assertEqual(notation(knights, "Nfd2"), "f3d2")
+        self.assertIsNone(notation(knights, "Nd2"))
+        rooks = "4k3/R7/8/8/8/8/8/R3K3 w - - 0 1"
+        self.assertEqual(notation(rooks, "R1a4"), "a1a4")
+        self.assertEqual(notation(rooks, "R7a4"), "a7a4")
+        self.assertEqual(notation(rooks, "Ra1a4"), "a1a4")
+        self.assertIsNone(notation(rooks, "Ra4"))
+
+    def test_castling(self):
+        fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
+        self.assertEqual(notation(fen, "O-O"), "e1g1")
+        self.assertEqual(notation(fen, "O-O-O"), "e1c1")
+        self.assertEqual(notation(fen, "0-0-0+"), "e1c1")
+        self.assertEqual(notation(fen.replace(" w ", " b "), "O-O"), "e8g8")
+        self.assertIsNone(notation("r3k2r/8/8/8/8/8/8/R3K2R w - - 0 1", "O-O"))
+
+    def test_promotion(self):
+        fen = "3r4/4P3/8/8/8/8/k7/4K3 w - - 0 1"
+        self.assertEqual(notation(fen, "e8=Q"), "e7e8")
+        self.assertEqual(notation(fen, "e8Q"), "e7e8")
+        self.assertEqual(notation(fen, "exd8=Q+"), "e7d8")
+        self.assertIsNone(notation(fen, "e8=N"))  # only queen promotions are generated
+
+    def test_unknown_moves(self):
+        fen = Engine.ChessState().get_fen()
+        self.assertEqual(notation(fen, "e4"), "e2e4")
+        self.assertEqual(notation(fen, "Nf3!?"), "g1f3")
+        self.assertIsNone(notation(fen, "e5"))
+        self.assertIsNone(notation(fen, "Qh5"))
+        self.assertIsNone(notation(fen, "Z"))
+
+
+if __name__ == "__main__":
+    unittest.main()
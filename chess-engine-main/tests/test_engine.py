@@ -0,0 +1,135 @@
+import unittest
+
+import Engine
+from Perft import PERFT_SUITE, PerftCounter
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+MAX_PERFT_NODES = 10000  # keeps the run to a few seconds; Perft.py covers the deep counts
+
+
+def play(game_state, notations):
+    for notation in notations:
+        game_state.make_move(next(move for move in game_state.generate_legal_moves()
+                                  if move.get_notation() == notation))
+
+
+def snapshot(game_state):
+    return (game_state.get_fen(), game_state.zobrist_key, dict(game_state.bitboards), dict(game_state.piece_counts),
+            game_state.material_score, game_state.positional_score, game_state.white_king_pos,
+            game_state.black_king_pos, game_state.castle_rights.mask(), len(game_state.state_stack))
+
+
+class PerftTest(unittest.TestCase):
+    def test_reference_counts(self):
+        for name, fen, counts in PERFT_SUITE:
+            for depth, expected in sorted(counts.items()):
+                if expected > MAX_PERFT_NODES:
+                    continue
+                with self.subTest(position=name, depth=depth):
+                    counter = PerftCounter()
+                    self.assertEqual(counter.perft(Engine.ChessState(fen), depth), expected)
+                    self.assertEqual(counter.restore_errors, 0)
+
+
+class MakeUndoTest(unittest.TestCase):
+    def check_tree(self, game_state, depth):
+        before = snapshot(game_state)
+        for move in game_state.generate_legal_moves():
+            game_state.make_move(move)
+            self.assertEqual(game_state.zobrist_key, game_state.compute_zobrist_key(), move.get_notation())
+            if depth > 1:
+                self.check_tree(game_state, depth - 1)
+            game_state.undo_move()
+            self.assertEqual(snapshot(game_state), before, move.get_notation())
+
+    def test_make_undo_restores_state(self):
+        for fen in (KIWIPETE, "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"):
+            with self.subTest(fen=fen):
+                self.check_tree(Engine.ChessState(fen), 2)
+
+    def test_null_move_restores_state(self):
+        game_state = Engine.ChessState("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3")
+        before = snapshot(game_state)
+        game_state.make_null_move()
+        self.assertFalse(game_state.white_turn)
+        self.assertEqual(game_state.zobrist_key, game_state.compute_zobrist_key())
+        game_state.undo_move()
+        self.assertEqual(snapshot(game_state), before)
+
+
+class EnPassantTest(unittest.TestCase):
+    def test_fen_and_played_positions_share_a_key(self):
+        played = Engine.ChessState()
+        play(played, ["e2e4"])
+        for enpassant in ("-", "e3"):
+            loaded = Engine.ChessState(f"rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq {enpassant} 0 1")
+            self.assertEqual(loaded.zobrist_key, played.zobrist_key)
+        self.assertEqual(played.enpassant_target, ())
+        self.assertEqual(played.get_fen().split()[3], "-")
+
+    def test_target_kept_when_capture_is_possible(self):
+        game_state = Engine.ChessState("rnbqkbnr/ppp1pppp/8/8/3p4/8/PPPPPPPP/RNBQKBNR w KQkq - 0 3")
+        play(game_state, ["e2e4"])
+        self.assertEqual(game_state.get_fen().split()[3], "e3")
+        self.assertIn("d4e3", [move.get_notation() for move in game_state.generate_legal_moves()])
+
+    def test_pinned_pawn_does_not_create_a_target(self):
+        game_state = Engine.ChessState("8/8/8/8/k2p3R/8/4P3/4K3 w - - 0 1")
+        play(game_state, ["e2e4"])
+        self.assertEqual(game_state.enpassant_target, ())
+
+
+    def test_fen_target_must_follow_a_double_push(self):
+        # e3 with White to move would let d2 take its own e2 pawn en passant
+        with self.assertRaises(ValueError):
+            Engine.ChessState("4k3/8/8/8/8/8/3PP3/4K3 w - e3 0 1")
+        game_state = Engine.ChessState("4k3/8/8/8/8/8/3PP3/4K3 b - e3 0 1")
+        self.assertEqual(game_state.enpassant_target, ())
+        game_state = Engine.ChessState("4k3/8/8/8/3p4/8/3PP3/4K3 b - e3 0 1")
+        self.assertEqual(game_state.enpassant_target, ())
+        self.assertFalse(any(move.is_enpassant for move in game_state.get_legal_moves()))
+
+
+class DrawTest(unittest.TestCase):
+    def test_threefold_repetition_after_double_push(self):
+        # The position after 1.e4 occurs three times; its first occurrence follows a double push
+        game_state = Engine.ChessState()
+        play(game_state, ["e2e4", "g8f6", "g1f3", "f6g8", "f3g1", "g8f6", "g1f3", "f6g8"])
+        self.assertEqual(game_state.repetitions(), 1)
+        self.assertTrue(game_state.get_legal_moves())
+        play(game_state, ["f3g1"])
+        self.assertEqual(game_state.repetitions(), 2)
+        self.assertEqual(game_state.get_legal_moves(), [])
+        self.assertEqual(game_state.draw_reason, "threefold repetition")
+
+    def test_fifty_move_rule_yields_to_checkmate(self):
+        game_state = Engine.ChessState("4k3/8/8/8/8/8/8/R3K3 w Q - 99 80")
+        play(game_state, ["a1a2"])
+        self.assertEqual(game_state.draw_reason, None)
+        self.assertEqual(game_state.get_legal_moves(), [])
+        self.assertEqual(game_state.draw_reason, "fifty-move rule")
+        game_state = Engine.ChessState("7k/5Q2/6K1/8/8/8/8/8 w - - 99 80")
+        play(game_state, ["f7g7"])
+        self.assertEqual(game_state.get_legal_moves(), [])
+        self.assertTrue(game_state.checkmate)
+
+    def test_insufficient_material(self):
+        for fen, drawn in [("8/8/4k3/8/8/8/8/4K3 w - - 0 1", True),
+                           ("8/8/4k3/8/8/2N5/8/4K3 w - - 0 1", True),
+                           ("8/8/4k3/2b5/8/2B5/8/4K3 w - - 0 1", True),
+                           ("8/8/4k3/3b4/8/2B5/8/4K3 w - - 0 1", False),
+                           ("8/8/4k3/8/8/1NN5/8/4K3 w - - 0 1", False)]:
+            with self.subTest(fen=fen):
+                self.assertEqual(Engine.ChessState(fen).insufficient_material(), drawn)
+
+
+class FenTest(unittest.TestCase):
+    def test_castling_rights_need_king_and_rook_at_home(self):
+        game_state = Engine.ChessState("4k3/p7/8/8/8/8/8/4K3 w K - 0 1")
+        self.assertFalse(any(move.is_castling for move in game_state.get_legal_moves()))
+        self.assertEqual(Engine.ChessState("r3k2r/8/8/8/8/8/8/R3K1R1 w KQkq - 0 1").get_fen().split()[2], "Qkq")
+
+
+if __name__ == "__main__":
+    unittest.main()
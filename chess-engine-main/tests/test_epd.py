@@ -0,0 +1,35 @@
+import unittest
+
+import Engine
+from Epd import format_epd, parse_epd
+
+
+class ParseEpdTest(unittest.TestCase):
+    def test_operations(self):
+        fen, operations = parse_epd('r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - '
+                                    'bm Bb5 Bc4; id "open; game"; c0 "";hmvc 2; fmvn 3;')
+        self.assertEqual(fen, "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3")
+        self.assertEqual(operations, {"bm": ["Bb5", "Bc4"], "id": ["open; game"], "c0": [""],
+                                      "hmvc": ["2"], "fmvn": ["3"]})
+
+    def test_position_only(self):
+        fen, operations = parse_epd("4k3/8/8/8/8/8/8/4K3 b - -")
+        self.assertEqual(fen, "4k3/8/8/8/8/8/8/4K3 b - - 0 1")
+        self.assertEqual(operations, {})
+
+    def test_malformed_lines(self):
+        for line in ("4k3/8/8/8/8/8/8/4K3 w -", "4k3/8/8/8/8/8/8/4K3 w - - bm e4",
+                     '4k3/8/8/8/8/8/8/4K3 w - - id "unterminated;'):
+            with self.subTest(line=line):
+                with self.assertRaises(ValueError):
+                    parse_epd(line)
+
+    def test_format_round_trip(self):
+        operations = {"bm": ["Nf3", "e4"], "id": ["start; test"], "c0": [""]}
+        line = format_epd(Engine.ChessState(), operations)
+        self.assertEqual(line, 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - bm Nf3 e4; id "start; test"; c0 "";')
+        self.assertEqual(parse_epd(line), (Engine.ChessState().get_fen(), operations))
+
+
+if __name__ == "__main__":
+    unittest.main()
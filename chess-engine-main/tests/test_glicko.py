@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+import Glicko
+
+
+def to_internal(rating, deviation):
+    return (rating - Glicko.DEFAULT_RATING) / Glicko.SCALE, deviation / Glicko.SCALE
+
+
+class GlickoTest(unittest.TestCase):
+    def test_glickman_worked_example(self):
+        # Section "Example of the Glicko-2 system" in Glickman's paper: a 1500/200 player beats
+        # a 1400/30 player and loses to 1550/100 and 1700/300 players, with tau = 0.5
+        players = [to_internal(1500, 200), to_internal(1400, 30), to_internal(1550, 100), to_internal(1700, 300)]
+        mu, phi = (np.array(values) for values in zip(*players))
+        sigma = np.full(4, 0.06)
+        mu, phi, sigma = Glicko.rate_period(mu, phi, sigma, np.array([0, 0, 0]), np.array([1, 2, 3]),
+                                            np.array([1.0, 0.0, 0.0]), tau=0.5)
+        self.assertAlmostEqual(Glicko.DEFAULT_RATING + Glicko.SCALE * mu[0], 1464.05, delta=0.01)
+        self.assertAlmostEqual(Glicko.SCALE * phi[0], 151.52, delta=0.01)
+        self.assertAlmostEqual(sigma[0], 0.05999, delta=0.00001)
+
+    def test_idle_player_only_gains_deviation(self):
+        mu, phi, sigma = np.zeros(3), np.full(3, 1.0), np.full(3, 0.06)
+        new_mu, new_phi, new_sigma = Glicko.rate_period(mu, phi, sigma, np.array([0]), np.array([1]), np.array([0.5]))
+        self.assertEqual(new_mu[2], 0)
+        self.assertAlmostEqual(new_phi[2], np.sqrt(1 + 0.06 ** 2))
+        self.assertEqual(new_sigma[2], 0.06)
+
+
+if __name__ == "__main__":
+    unittest.main()
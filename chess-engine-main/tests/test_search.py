@@ -0,0 +1,71 @@
+import unittest
+
+import AI
+import Engine
+
+INFINITY = AI.CHECKMATE + 1
+
+
+def plain_alpha_beta(game_state, depth, alpha, beta, context, ply=0):
+    # Fixed-depth alpha-beta with no hash table, move ordering, null move, reductions or windows,
+    # ending in the engine's own quiescence so that only the pruning in between is compared
+    if depth == 0:
+        return AI.quiescence(game_state, alpha, beta, 2000, context, ply)
+    moves = game_state.generate_legal_moves()
+    if not moves:
+        return -(AI.CHECKMATE - ply) if game_state.in_check() else AI.STALEMATE
+    best = -INFINITY
+    for move in moves:
+        game_state.make_move(move)
+        best = max(best, -plain_alpha_beta(game_state, depth - 1, -beta, -alpha, context, ply + 1))
+        game_state.undo_move()
+        alpha = max(alpha, best)
+        if alpha >= beta:
+            break
+    return best
+
+
+def analyse(fen, depth):
+    AI.transposition_table.clear()
+    stats = AI.SearchStats()
+    move = AI.analyse_position(Engine.ChessState(fen), depth, stats=stats)
+    return move, stats.iterations[-1]
+
+
+class SearchTest(unittest.TestCase):
+    def test_pruned_search_matches_plain_alpha_beta(self):
+        # Depth 4 is the first depth at which null moves and late move reductions are tried below the root
+        for fen, depth in [("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 4),
+                           (Engine.ChessState().get_fen(), 4),
+                           ("r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3", 3)]:
+            with self.subTest(fen=fen):
+                game_state = Engine.ChessState(fen)
+                side = 1 if game_state.white_turn else -1
+                context = AI.SearchContext(AI.TranspositionTable(1))
+                expected = plain_alpha_beta(game_state, depth, -INFINITY, INFINITY, context) * side
+                self.assertAlmostEqual(analyse(fen, depth)[1]["score"], expected)
+
+    def test_finds_mate_in_one(self):
+        move, iteration = analyse("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", 2)
+        self.assertEqual(move.get_notation(), "d1d8")
+        self.assertEqual(iteration["score"], AI.CHECKMATE - 1)
+
+    def test_finds_mate_in_two(self):
+        move, iteration = analyse("1r4k1/5ppp/8/8/8/8/4RPPP/4R1K1 w - - 0 1", 4)
+        self.assertEqual(move.get_notation(), "e2e8")
+        self.assertEqual(iteration["score"], AI.CHECKMATE - 3)
+        self.assertEqual(iteration["pv"], ["e2e8", "b8e8", "e1e8"])
+
+    def test_scores_are_from_whites_point_of_view(self):
+        for fen, expected in [("4r1k1/4rppp/8/8/8/8/5PPP/1R4K1 b - - 0 1", -(AI.CHECKMATE - 3)),
+                              ("1r4k1/5ppp/8/8/8/8/4RPPP/4R1K1 w - - 0 1", AI.CHECKMATE - 3)]:
+            with self.subTest(fen=fen):
+                self.assertEqual(analyse(fen, 4)[1]["score"], expected)
+        # White is a rook down whichever side is to move
+        for side in ("w", "b"):
+            with self.subTest(side=side):
+                self.assertLess(analyse(f"rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQK3 {side} Qkq - 0 1", 3)[1]["score"], -4)
+
+
+if __name__ == "__main__":
+    unittest.main()
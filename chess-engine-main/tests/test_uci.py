@@ -0,0 +1,50 @@
+import io
+import time
+import unittest
+from unittest import mock
+
+import AI
+import Uci
+
+
+class UciTest(unittest.TestCase):
+    def setUp(self):
+        self.output = io.StringIO()
+        self.engine = Uci.UciEngine(self.output)
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def lines(self):
+        return self.output.getvalue().splitlines()
+
+    def test_infinite_search_waits_for_stop(self):
+        # A book or tablebase hit returns at once; bestmove must still wait for "stop"
+        def instant_move(game_state, valid_moves, *args, **kwargs):
+            return valid_moves[0]
+
+        with mock.patch.object(AI, "pick_best_move", instant_move):
+            self.engine.handle("position startpos")
+            self.engine.handle("go infinite")
+            time.sleep(0.2)
+            self.assertFalse(any(line.startswith("bestmove") for line in self.lines()))
+            self.engine.handle("stop")
+        self.assertTrue(self.lines()[-1].startswith("bestmove"))
+
+    def test_depth_search_reports_iterations(self):
+        self.engine.handle("position startpos moves e2e4")
+        self.engine.handle("go depth 2")
+        self.engine.search_thread.join()
+        lines = self.lines()
+        self.assertTrue(lines[0].startswith("info depth 1 "))
+        self.assertTrue(lines[-1].startswith("bestmove "))
+
+    def test_scores(self):
+        self.assertEqual(Uci.uci_score(1.234), "cp 123")
+        self.assertEqual(Uci.uci_score(AI.CHECKMATE - 1), "mate 1")
+        self.assertEqual(Uci.uci_score(-(AI.CHECKMATE - 4)), "mate -2")
+        self.assertEqual(Uci.uci_score(AI.TABLEBASE_WIN - 5), "mate 3")
+
+
+if __name__ == "__main__":
+    unittest.main()